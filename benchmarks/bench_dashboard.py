@@ -0,0 +1,219 @@
+"""
+Benchmark suite for the dashboard's data and render paths.
+For every combination of --years, --gates and --bucket-minutes it writes a
+synthetic gate-counter fixture (entry_flow.synthetic_readings), then times, in a fresh process: ingestion, the store
+build, each query function, DataFrame construction, a full headless rerun of
+streamlit_app.py (Streamlit's AppTest), the elements and bytes a rerun sends,
+and figure serialization.
+Cold starts (ingestion plus the store build via `entry_flow.py precompute`)
+are timed for each --workers count to show how the build scales with cores.
+Run: python benchmarks/bench_dashboard.py [--years 2 5] [--gates 5 20] [--bucket-minutes 60] [--workers 1 2 4]
+"""
+
+import argparse
+import atexit
+import itertools
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP  = os.path.join(ROOT, "streamlit_app.py")
+LAST_YEAR = 2026
+
+
+def timed(fn, repeat=1):
+    """Median wall time of fn() in seconds over `repeat` calls."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples)
+
+
+def bucket_count(years, bucket_minutes):
+    start = np.datetime64(f"{LAST_YEAR - years + 1}-01-01T00:00")
+    end   = np.datetime64(f"{LAST_YEAR + 1}-01-01T00:00")
+    return int((end - start) // np.timedelta64(bucket_minutes, "m"))
+
+
+def make_fixture(path, years, gates, bucket_minutes):
+    """Write a synthetic counter export, streamed one year at a time."""
+    sys.path.insert(0, ROOT)
+    import entry_flow as ef
+
+    chunks = ef.synthetic_readings(range(LAST_YEAR - years + 1, LAST_YEAR + 1), gates, bucket_minutes)
+    ef.export(chunks, os.path.splitext(path)[1].lstrip("."), path)
+
+
+def fixture_path(work_dir, years, gates, bucket_minutes):
+    try:
+        import pyarrow  # noqa: F401
+        ext = "parquet"
+    except ImportError:
+        ext = "csv"
+    return os.path.join(work_dir, f"synthetic-{years}y-{gates}g-{bucket_minutes}m.{ext}")
+
+
+def page_payload(at):
+    """(elements, serialized bytes) of the page an AppTest last rendered."""
+    def walk(node):
+        yield node
+        for child in getattr(node, "children", {}).values():
+            yield from walk(child)
+    protos = [n.proto for n in walk(at._tree) if getattr(n, "proto", None) is not None]
+    return len(protos), sum(p.ByteSize() for p in protos)
+
+
+def drop_bucket_cache(fixture):
+    for stale in (fixture + ".buckets.npy", fixture + ".buckets.json"):
+        if os.path.exists(stale):
+            os.remove(stale)
+
+
+def cold_start(fixture, workers, work_dir):
+    """Wall time of a from-scratch `entry_flow.py precompute` in a new process."""
+    drop_bucket_cache(fixture)
+    store = tempfile.mkdtemp(dir=work_dir)
+    try:
+        env = dict(os.environ, ENTRY_FLOW_SOURCE=fixture, ENTRY_FLOW_STORE=store)
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(ROOT, "entry_flow.py"), "precompute",
+                        "--workers", str(workers)], env=env, check=True, capture_output=True)
+        return time.perf_counter() - t0
+    finally:
+        shutil.rmtree(store, True)
+
+
+def run_case(years, gates, bucket_minutes, reruns, work_dir, workers=()):
+    """Time one size configuration; runs in its own process."""
+    fixture = fixture_path(work_dir, years, gates, bucket_minutes)
+    out = {"years": years, "gates": gates, "bucket_minutes": bucket_minutes}
+    for n in workers:
+        out[f"cold_start_{n}w_s"] = cold_start(fixture, n, work_dir)
+    drop_bucket_cache(fixture)
+    os.environ["ENTRY_FLOW_SOURCE"] = fixture
+    os.environ["ENTRY_FLOW_STORE"]  = tempfile.mkdtemp(dir=work_dir)
+    atexit.register(shutil.rmtree, os.environ["ENTRY_FLOW_STORE"], True)
+
+    t0 = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    import entry_flow as ef
+    store = ef.load_store()
+    out["build_s"] = time.perf_counter() - t0
+    out["ingest_s"] = timed(lambda: ef.aggregate_counts(fixture))
+    out["rows"] = bucket_count(years, bucket_minutes) * gates * len(ef.ENTRY_TYPES)
+
+    years, aps = ef.site_axes()
+    yr1, yr2, ap = years[-1], years[0], aps[0]
+    out["rollup_day_s"]  = timed(lambda: ef.rollup(store["Hour"], "Day", years), 3)
+    out["ytd_index_s"]   = timed(lambda: ef.build_ytd_index(store["Month"]), 3)
+    out["get_ap_us"]      = timed(lambda: ef.get_ap(yr1, "Jun", ap, "Car"), 200) * 1e6
+    out["get_ytd_us"]     = timed(lambda: ef.get_ytd(yr1, "Jun", "Car"), 200) * 1e6
+    out["get_monthly_us"] = timed(lambda: ef.get_monthly(yr1, "Jun"), 200) * 1e6
+    for g in ef.GRANULARITIES:
+        out[f"get_series_{g.lower()}_us"] = timed(lambda: ef.get_series(yr1, g, "Jun"), 50) * 1e6
+    out["yoy_rows_ms"] = timed(lambda: list(ef.yoy_rows(yr1, yr2)), 3) * 1e3
+
+    import pandas as pd
+    rows = list(ef.yoy_rows(yr1, yr2))
+    out["dataframe_ms"] = timed(lambda: pd.DataFrame(rows), 10) * 1e3
+
+    from streamlit.testing.v1 import AppTest
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    at = AppTest.from_file(APP, default_timeout=300)
+    out["first_run_s"] = timed(at.run)
+    if at.exception:
+        raise RuntimeError(at.exception)
+    selections = itertools.cycle([
+        ("month", "Mar"), ("chart_type", "Car"), ("granularity", "Day"), ("year2", years[-2]),
+        ("month", "Jan"), ("chart_type", "All"), ("granularity", "Month"), ("year2", years[0]),
+    ])
+    samples = []
+    for _ in range(reruns):
+        key, value = next(selections)
+        at.selectbox(key=key).set_value(value)
+        samples.append(timed(at.run))
+    out["rerun_p50_ms"] = statistics.median(samples) * 1e3
+    out["rerun_max_ms"] = max(samples) * 1e3
+    out["elements"], page_bytes = page_payload(at)
+    out["page_kb"] = page_bytes / 1024
+
+    at.selectbox(key="granularity").set_value("Hour").run()
+    figs = [go.Figure(json.loads(c.proto.spec)) for c in at.get("plotly_chart")]
+    out["figure_bytes"] = sum(len(c.proto.spec) for c in at.get("plotly_chart"))
+    out["figure_json_ms"] = timed(lambda: [pio.to_json(f, validate=False) for f in figs], 10) * 1e3
+    return out
+
+
+# (result key, column label, format); the JSON output has every key
+COLUMNS = [
+    ("years", "years", "{:>5}"), ("gates", "gates", "{:>5}"), ("bucket_minutes", "min", "{:>4}"),
+    ("rows", "rows", "{:>10,}"), ("build_s", "build s", "{:>8.2f}"), ("ingest_s", "ingest s", "{:>8.2f}"),
+    ("rollup_day_s", "rollup s", "{:>8.4f}"), ("get_ytd_us", "ytd µs", "{:>7.1f}"),
+    ("get_ap_us", "ap µs", "{:>7.1f}"), ("get_series_hour_us", "hour µs", "{:>8.1f}"),
+    ("yoy_rows_ms", "yoy ms", "{:>7.1f}"), ("dataframe_ms", "df ms", "{:>6.2f}"),
+    ("first_run_s", "1st run s", "{:>9.2f}"), ("rerun_p50_ms", "rerun ms", "{:>8.1f}"),
+    ("elements", "elems", "{:>5}"), ("page_kb", "page KB", "{:>7.1f}"),
+    ("figure_json_ms", "fig ms", "{:>7.2f}"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, nargs="+", default=[2, 5], help="Years of data (at least 2)")
+    parser.add_argument("--gates", type=int, nargs="+", default=[5, 20])
+    parser.add_argument("--bucket-minutes", type=int, nargs="+", default=[60])
+    parser.add_argument("--reruns", type=int, default=16, help="Simulated widget changes per case")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="Build process counts to time cold starts with")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "entry_flow_bench"),
+                        help="Where fixtures and stores are kept between runs")
+    parser.add_argument("--json", help="Also write every result to this file")
+    parser.add_argument("--child", nargs=3, type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_case(*args.child, args.reruns, args.work_dir, args.workers)))
+        return
+
+    columns = COLUMNS + [(f"cold_start_{n}w_s", f"cold {n}w s", "{:>9.2f}") for n in args.workers]
+    os.makedirs(args.work_dir, exist_ok=True)
+    print(" ".join(label.rjust(len(fmt.format(0))) for _, label, fmt in columns))
+    results = []
+    for years, gates, minutes in itertools.product(args.years, args.gates, args.bucket_minutes):
+        # Fixtures are made here, not in the child, which must import
+        # entry_flow only after pointing it at the fixture
+        fixture = fixture_path(args.work_dir, years, gates, minutes)
+        if not os.path.exists(fixture):
+            make_fixture(fixture, years, gates, minutes)
+        proc = subprocess.run(
+            [sys.executable, __file__, "--child", str(years), str(gates), str(minutes),
+             "--reruns", str(args.reruns), "--work-dir", args.work_dir,
+             "--workers", *map(str, args.workers)],
+            capture_output=True, text=True,
+        )
+        if proc.returncode:
+            sys.stderr.write(proc.stderr)
+            raise SystemExit(f"case {years}y/{gates}g/{minutes}m failed")
+        res = json.loads(proc.stdout.strip().splitlines()[-1])
+        results.append(res)
+        print(" ".join(fmt.format(res[key]) for key, _, fmt in columns), flush=True)
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
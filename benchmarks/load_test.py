@@ -0,0 +1,240 @@
+"""
+Concurrent-session load test for the dashboard.
+Starts `streamlit run streamlit_app.py` on a local port and, for each --sessions
+count, opens that many websocket sessions against it, speaking the browser's
+protocol (BackMsg rerun requests, ForwardMsg deltas). Each session changes the
+year1/year2/month/chart_ap/chart_type selectboxes at random with a think time
+between changes. Reports rerun latency percentiles (request to
+script_finished), and the server's CPU time and private memory growth per
+session. --max-p95-ms turns it into a regression gate: the exit status is 1 if
+any session count's p95 goes over it.
+Run: python benchmarks/load_test.py [--sessions 1 4 16] [--reruns 20] [--think-ms 250]
+Set ENTRY_FLOW_SOURCE to measure against a real export.
+Reads /proc, so Linux only.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+APP  = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app.py")
+KEYS = ["year1", "year2", "month", "chart_ap", "chart_type"]
+TICK = os.sysconf("SC_CLK_TCK")
+
+
+def pct(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def server_cpu_s(pid):
+    """User plus system CPU seconds of a process so far."""
+    with open(f"/proc/{pid}/stat") as fh:
+        fields = fh.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / TICK
+
+
+def server_memory_kb(pid):
+    """(rss, private) in kB of a process, from smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as fh:
+        for line in fh:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return fields["Rss"], fields["Private_Clean"] + fields["Private_Dirty"]
+
+
+def start_server(port):
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP, "--server.port", str(port),
+         "--server.headless", "true", "--server.fileWatcherType", "none",
+         "--server.enableXsrfProtection", "false", "--browser.gatherUsageStats", "false"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("streamlit server did not come up")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Session:
+    """One browser tab: keeps the widget values it has set and re-sends them on every rerun."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.values  = {}  # user key -> chosen option
+        self.widgets = {}  # user key -> Selectbox proto of the last run
+
+    async def rerun(self):
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = ""
+        for key, value in self.values.items():
+            widget = self.widgets.get(key)
+            # Options that no longer exist (year2 after a year1 change) are dropped
+            if widget is not None and value in widget.options:
+                msg.rerun_script.widget_states.widgets.append(WidgetState(id=widget.id, string_value=value))
+        await self.ws.send(msg.SerializeToString())
+
+        widgets = {}
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(await self.ws.recv())
+            kind = fwd.WhichOneof("type")
+            if kind == "delta" and fwd.delta.new_element.WhichOneof("type") == "selectbox":
+                box = fwd.delta.new_element.selectbox
+                key = box.id.rsplit("-", 1)[-1]
+                if key in KEYS:
+                    widgets[key] = box
+            elif kind == "script_finished":
+                break
+        self.widgets = widgets
+
+    def change(self, rng):
+        key = rng.choice([k for k in KEYS if k in self.widgets])
+        box = self.widgets[key]
+        current = self.values.get(key, box.options[box.default] if box.options else None)
+        self.values[key] = rng.choice([o for o in box.options if o != current] or list(box.options))
+
+
+async def run_session(url, reruns, think_s, seed, latencies, ready, go):
+    rng = random.Random(seed)
+    async with websockets.connect(url, subprotocols=["streamlit"], max_size=None) as ws:
+        session = Session(ws)
+        await session.rerun()  # first page load, not timed
+        ready.set()
+        await go.wait()
+        for _ in range(reruns):
+            await asyncio.sleep(think_s * rng.uniform(0.5, 1.5))
+            session.change(rng)
+            t0 = time.perf_counter()
+            await session.rerun()
+            latencies.append(time.perf_counter() - t0)
+
+
+async def run_phase(url, n, reruns, think_s, seed):
+    latencies = []
+    readies = [asyncio.Event() for _ in range(n)]
+    go = asyncio.Event()
+    tasks = [asyncio.create_task(run_session(url, reruns, think_s, seed + i, latencies, readies[i], go))
+             for i in range(n)]
+    waiting = asyncio.gather(*(r.wait() for r in readies))
+    done, _ = await asyncio.wait([asyncio.ensure_future(waiting), *tasks], return_when=asyncio.FIRST_COMPLETED)
+    for task in tasks:
+        if task in done and task.exception():
+            raise task.exception()
+    return latencies, go, tasks
+
+
+def measure(pid, url, n, reruns, think_s, seed):
+    """Run n sessions; returns latency percentiles and server CPU/memory per session."""
+    async def phase():
+        base_mem = server_memory_kb(pid)
+        latencies, go, tasks = await run_phase(url, n, reruns, think_s, seed)
+        # Every session has loaded its first page: memory now holds n sessions
+        loaded_mem = server_memory_kb(pid)
+        cpu0, t0 = server_cpu_s(pid), time.perf_counter()
+        go.set()
+        await asyncio.gather(*tasks)
+        return latencies, base_mem, loaded_mem, server_cpu_s(pid) - cpu0, time.perf_counter() - t0
+
+    latencies, (_, priv0), (rss, priv1), cpu_s, wall_s = asyncio.run(phase())
+    return {
+        "sessions": n,
+        "reruns": len(latencies),
+        "p50_ms": pct(latencies, 0.5) * 1e3,
+        "p95_ms": pct(latencies, 0.95) * 1e3,
+        "p99_ms": pct(latencies, 0.99) * 1e3,
+        "max_ms": max(latencies) * 1e3,
+        "mean_ms": statistics.fmean(latencies) * 1e3,
+        "throughput_rps": len(latencies) / wall_s,
+        "cpu_ms_per_rerun": cpu_s / len(latencies) * 1e3,
+        "cpu_pct_per_session": cpu_s / wall_s / n * 100,
+        "server_rss_mb": rss / 1024,
+        "private_kb_per_session": (priv1 - priv0) / n,
+    }
+
+
+# (result key, column label, format); the JSON output has every key
+COLUMNS = [
+    ("sessions", "sessions", "{:>8}"), ("reruns", "reruns", "{:>6}"),
+    ("p50_ms", "p50 ms", "{:>8.1f}"), ("p95_ms", "p95 ms", "{:>8.1f}"), ("p99_ms", "p99 ms", "{:>8.1f}"),
+    ("max_ms", "max ms", "{:>8.1f}"), ("throughput_rps", "rerun/s", "{:>7.1f}"),
+    ("cpu_ms_per_rerun", "cpu ms/rerun", "{:>12.1f}"), ("cpu_pct_per_session", "cpu %/sess", "{:>10.1f}"),
+    ("server_rss_mb", "rss MB", "{:>7.1f}"), ("private_kb_per_session", "Δpriv kB/sess", "{:>13,.0f}"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16],
+                        help="Concurrent session counts to run, one phase each")
+    parser.add_argument("--reruns", type=int, default=20, help="Widget changes per session")
+    parser.add_argument("--think-ms", type=float, default=250, help="Mean pause between a session's changes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="Test an already running server (ws://host:port/_stcore/stream) "
+                                      "instead of starting one; --pid gives its process for CPU and memory")
+    parser.add_argument("--pid", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--max-p95-ms", type=float, help="Exit with status 1 if any phase's p95 exceeds this")
+    parser.add_argument("--json", help="Also write every result to this file")
+    args = parser.parse_args()
+
+    proc = None
+    if args.url:
+        url, pid = args.url, args.pid
+        if pid is None:
+            parser.error("--url needs --pid")
+    else:
+        port = free_port()
+        proc = start_server(port)
+        url, pid = f"ws://127.0.0.1:{port}/_stcore/stream", proc.pid
+    try:
+        # One untimed session first, so the phases measure warm caches
+        measure(pid, url, 1, 1, 0, args.seed - 1)
+        print(" ".join(label.rjust(len(fmt.format(0))) for _, label, fmt in COLUMNS))
+        results = []
+        for n in args.sessions:
+            res = measure(pid, url, n, args.reruns, args.think_ms / 1e3, args.seed + 1000 * n)
+            results.append(res)
+            print(" ".join(fmt.format(res[key]) for key, _, fmt in COLUMNS), flush=True)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(results, fh, indent=2)
+    if args.max_p95_ms is not None:
+        over = [r["sessions"] for r in results if r["p95_ms"] > args.max_p95_ms]
+        if over:
+            raise SystemExit(f"p95 over {args.max_p95_ms:g} ms with {', '.join(map(str, over))} sessions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Per-session memory of the dashboard.
+Opens N headless sessions of streamlit_app.py in one process (Streamlit's
+AppTest), then in P concurrent processes, and prints RSS and
+private memory after each one. With the memory-mapped store the per-session
+and per-process private growth should stay flat.
+Run: python benchmarks/session_memory.py [--sessions 8] [--processes 4]
+Set ENTRY_FLOW_SOURCE to measure against a real export.
+Reads /proc, so Linux only.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+from streamlit.testing.v1 import AppTest
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app.py")
+
+
+def memory_kb():
+    """Return (rss, private) in kB for this process from smaps_rollup."""
+    fields = {}
+    with open("/proc/self/smaps_rollup") as fh:
+        for line in fh:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return fields["Rss"], fields["Private_Clean"] + fields["Private_Dirty"]
+
+
+def run_sessions(n):
+    sessions = []
+    base_rss, base_priv = memory_kb()
+    print(f"{'sessions':>8} {'rss MB':>9} {'private MB':>11} {'Δprivate/session kB':>20}")
+    prev_priv = base_priv
+    for i in range(1, n + 1):
+        at = AppTest.from_file(APP, default_timeout=120)
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception)
+        sessions.append(at)
+        rss, priv = memory_kb()
+        print(f"{i:>8} {rss / 1024:>9.1f} {priv / 1024:>11.1f} {priv - prev_priv:>20,}")
+        prev_priv = priv
+    return sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        at = AppTest.from_file(APP, default_timeout=120)
+        at.run()
+        rss, priv = memory_kb()
+        print(f"{rss} {priv}", flush=True)
+        sys.stdin.read()  # stay alive until the parent has measured every sibling
+        return
+
+    print("── Sessions in one process")
+    run_sessions(args.sessions)
+
+    print("\n── Concurrent processes (one session each)")
+    print(f"{'process':>8} {'rss MB':>9} {'private MB':>11} {'shared MB':>10}")
+    children = []
+    try:
+        for i in range(1, args.processes + 1):
+            child = subprocess.Popen(
+                [sys.executable, __file__, "--child"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+            )
+            children.append(child)
+            rss, priv = map(int, child.stdout.readline().split())
+            print(f"{i:>8} {rss / 1024:>9.1f} {priv / 1024:>11.1f} {(rss - priv) / 1024:>10.1f}")
+    finally:
+        for child in children:
+            child.stdin.close()
+            child.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1409 @@
+"""
+Visitor entry-flow data and query layer.
+Builds the per-site (year, month, access point, entry type) stores behind the
+dashboard and answers YoY queries over them, without importing Streamlit.
+Run: python entry_flow.py yoy 2026 2024 --format csv
+     python entry_flow.py precompute --workers 4
+     python entry_flow.py export detail.parquet
+"""
+
+import argparse
+import csv
+import functools
+import hashlib
+import itertools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import warnings
+import numpy as np
+
+import timing
+
+# ── Axes and synthetic data ───────────────────────────────────────────────
+MONTHS = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
+ACCESS_POINTS = ["Gate 1","Gate 3","Plaza Vea","Gate 7","Gate 9"]
+YEARS = [2022, 2023, 2024, 2025, 2026]
+
+# _s/_rng take scalars or arrays; np.sin matches math.sin bit for bit on these
+# seeds, and np.rint rounds half to even like round(), so values are unchanged.
+def _s(n):
+    x = np.sin(n * 9301 + 49297) * 233280
+    return x - np.floor(x)
+
+def _rng(base, variance, seed):
+    return np.rint(base + (_s(seed) - 0.5) * variance * 2).astype(np.int64)
+
+ENTRY_TYPES = ["Pedestrian", "Car", "Taxi"]
+
+# Synthetic (base, variance) per entry type in 2022, growing 8% a year
+SYNTHETIC_PROFILE = [(90000, 25000), (40000, 12000), (18000, 8000)]
+
+def synthetic_cube(years=None, n_gates=None, site_index=0):
+    """Synthetic (year, month, gate, type) cube for any number of years and gates.
+
+    Same seeds as the original per-cell loop, so the default axes reproduce
+    the dashboard's values exactly. Each further synthetic site shifts the
+    seeds by site_index so sites differ.
+    """
+    years   = np.asarray(YEARS if years is None else years)
+    n_gates = len(ACCESS_POINTS) if n_gates is None else n_gates
+    growth  = 1 + (years - 2022) * 0.08
+    seed = years[:, None, None] * 1000 + np.arange(len(MONTHS))[:, None] * 10 + np.arange(n_gates)
+    seed = seed + site_index * 10_000_000
+    cube = np.empty(seed.shape + (len(ENTRY_TYPES),), dtype=np.int64)
+    for ti, (base, variance) in enumerate(SYNTHETIC_PROFILE):
+        cube[..., ti] = _rng(np.rint(base * growth)[:, None, None], variance, seed + ti + 1)
+    return cube
+
+
+# ── Time buckets ──────────────────────────────────────────────────────────
+# Sub-day data is kept as hourly buckets per year, padded to a leap year so
+# every year has the same number of slots, with rollups to day, week and month.
+HOURS_PER_YEAR = 366 * 24
+GRANULARITIES  = ["Month", "Week", "Day", "Hour"]
+ROLLUP_SLOTS   = {"Month": 12, "Week": 53, "Day": 366}
+
+# Relative share of a day's visitors per hour: closed overnight, lunch and evening peaks
+HOUR_PROFILE = np.array([0, 0, 0, 0, 0, 0, 0, 0, 0, 0.2, 0.6, 1.0,
+                         1.4, 1.5, 1.2, 1.0, 1.0, 1.2, 1.5, 1.6, 1.3, 0.8, 0.3, 0])
+
+def _month_starts(yr):
+    """Hour offset of each month start within yr, followed by the year end."""
+    starts = np.arange(f"{yr}-01", f"{yr + 1}-02", dtype="datetime64[M]").astype("datetime64[h]")
+    return (starts - starts[0]).astype(np.int64)
+
+
+# ── Gate-counter ingestion ────────────────────────────────────────────────
+# Set ENTRY_FLOW_SOURCE to a CSV or Parquet export with one row per reading:
+# timestamp, access_point, entry_type, count. Without it the synthetic data
+# above is used.
+DATA_SOURCE   = os.environ.get("ENTRY_FLOW_SOURCE")
+COUNT_COLUMNS = ["timestamp", "access_point", "entry_type", "count"]
+CHUNK_ROWS    = 500_000
+
+# pandas is imported inside the ingestion and append paths only: it roughly
+# doubles the import time, and read-only queries (the CLI) never need it.
+
+def _iter_chunks(path, chunksize, part=0, parts=1):
+    import pandas as pd
+    if path.endswith((".parquet", ".pq")):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ImportError("Reading Parquet sources requires pyarrow") from exc
+        source = pq.ParquetFile(path)
+        groups = list(range(part, source.num_row_groups, parts))
+        if groups:
+            for batch in source.iter_batches(batch_size=chunksize, row_groups=groups, columns=COUNT_COLUMNS):
+                yield batch.to_pandas()
+    elif part == 0:
+        yield from pd.read_csv(path, usecols=COUNT_COLUMNS, chunksize=chunksize)
+
+def count_totals(path, chunksize=CHUNK_ROWS, part=0, parts=1):
+    """Summed readings per (year, hour of year, gate, type) for one share of an export.
+
+    Parquet row groups are dealt round-robin over `parts` so that several
+    processes can each read a share; a CSV is read whole by part 0. Returns
+    None when the share holds no rows.
+    """
+    import pandas as pd
+    totals = None
+    chunks = []
+    for chunk in _iter_chunks(path, chunksize, part, parts):
+        ts = pd.to_datetime(chunk["timestamp"])
+        hour = (ts.dt.dayofyear - 1) * 24 + ts.dt.hour
+        chunks.append(chunk["count"].groupby(
+            [ts.dt.year, hour, chunk["access_point"], chunk["entry_type"]]
+        ).sum())
+        # Fold partials every so often so memory tracks distinct cells, not rows
+        if len(chunks) >= 32:
+            totals = _merge_totals([totals] + chunks)
+            chunks = []
+    return _merge_totals([totals] + chunks)
+
+def _merge_totals(partials):
+    import pandas as pd
+    partials = [p for p in partials if p is not None]
+    if not partials:
+        return None
+    return pd.concat(partials).groupby(level=[0, 1, 2, 3]).sum()
+
+def aggregate_counts(path, chunksize=CHUNK_ROWS, partials=None):
+    """Stream a gate-counter export into (year, hour of year, gate, type) buckets.
+
+    partials, if given, are count_totals() results covering every share of
+    the export, read elsewhere; they are merged instead of reading the file.
+    """
+    import pandas as pd
+    totals = _merge_totals(partials if partials is not None else [count_totals(path, chunksize)])
+    if totals is None or totals.empty:
+        raise ValueError(f"{path} contains no counter readings")
+
+    yr, hr, ap, et = (totals.index.get_level_values(i) for i in range(4))
+    unknown = sorted(set(et) - set(ENTRY_TYPES))
+    if unknown:
+        raise ValueError(f"{path} has unknown entry types: {', '.join(map(str, unknown))}")
+
+    years = sorted(int(y) for y in set(yr))
+    aps   = sorted(str(a) for a in set(ap))
+    if len(years) < 2:
+        raise ValueError(f"{path} only covers {years[0]}; the dashboard compares years, so an export needs at least two")
+    buckets = np.zeros((len(years), HOURS_PER_YEAR, len(aps), len(ENTRY_TYPES)), dtype=np.int64)
+    np.add.at(buckets, (
+        pd.Index(years).get_indexer(yr),
+        np.asarray(hr),
+        pd.Index(aps).get_indexer(ap.astype(str)),
+        pd.Index(ENTRY_TYPES).get_indexer(et),
+    ), totals.to_numpy(dtype=np.int64))
+    return buckets, years, aps
+
+CACHE_VERSION = 2  # bump when the bucket cache format changes, or to drop caches written to in place
+
+def _cached_counts(path):
+    """The source's .npy bucket cache as load_counts() returns it, or None if stale."""
+    info = os.stat(path)
+    try:
+        with open(path + ".buckets.json") as fh:
+            meta = json.load(fh)
+        if (meta.get("version") == CACHE_VERSION
+                and meta["source"] == {"mtime_ns": info.st_mtime_ns, "size": info.st_size}):
+            return np.load(path + ".buckets.npy", mmap_mode="r"), meta["years"], meta["access_points"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+def load_counts(path, chunksize=CHUNK_ROWS, partials=None):
+    """Return (hourly buckets, years, access_points), reusing the .npy cache when fresh.
+
+    The cache sits next to the source and is keyed by its mtime and size, so
+    restarts skip re-parsing until the export changes. It is mapped read-only:
+    it must always equal the export, so appended readings go to the store's
+    own copy of the hours instead.
+    """
+    cached = _cached_counts(path)
+    if cached is not None:
+        return cached
+
+    info  = os.stat(path)
+    stamp = {"mtime_ns": info.st_mtime_ns, "size": info.st_size}
+    cube_path, meta_path = path + ".buckets.npy", path + ".buckets.json"
+    buckets, years, aps = aggregate_counts(path, chunksize, partials)
+    _save_npy(cube_path, buckets)
+    tmp = _temp_beside(meta_path)
+    with open(tmp, "w") as fh:
+        json.dump({"version": CACHE_VERSION, "source": stamp, "years": years, "access_points": aps}, fh)
+    os.replace(tmp, meta_path)
+    return np.load(cube_path, mmap_mode="r"), years, aps
+
+def _temp_beside(path):
+    # A temp file of this writer's own next to path, to os.replace() over it:
+    # writers in other threads or processes never share one
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    return tmp
+
+def _save_npy(path, arr):
+    # Write-then-rename so concurrent readers never map a half-written file
+    tmp = _temp_beside(path)
+    with open(tmp, "wb") as fh:
+        np.save(fh, arr)
+    os.replace(tmp, path)
+
+_SOURCES = {}
+# One lock per source export or site store: whoever finds it missing builds it
+# under the lock while other threads (sessions, the refresher) wait for it
+_LOAD_LOCKS = {}
+
+def load_source(path):
+    """load_counts() of a source export, kept until the file changes."""
+    mtime = os.stat(path).st_mtime_ns
+    hit   = _SOURCES.get(path)
+    if hit is None or hit[0] != mtime:
+        with _LOAD_LOCKS.setdefault(path, threading.Lock()):
+            hit = _SOURCES.get(path)
+            if hit is None or hit[0] != mtime:
+                hit = _SOURCES[path] = (mtime, load_counts(path))
+    return hit[1]
+
+# ── Sites ─────────────────────────────────────────────────────────────────
+# ENTRY_FLOW_SOURCE may also be a directory with one export per site; the file
+# name without its extension is the site name. Without a source,
+# ENTRY_FLOW_SITES lists the synthetic sites (comma separated). Each site has
+# its own years and access points. "All sites" is a rollup store whose
+# access-point axis is the sites themselves.
+ALL_SITES    = "All sites"
+SOURCE_EXTS  = (".csv", ".parquet", ".pq")
+
+def _discover_sites():
+    if DATA_SOURCE and os.path.isdir(DATA_SOURCE):
+        sites = {os.path.splitext(f)[0]: os.path.join(DATA_SOURCE, f)
+                 for f in sorted(os.listdir(DATA_SOURCE)) if f.endswith(SOURCE_EXTS)}
+        if not sites:
+            raise ValueError(f"{DATA_SOURCE} holds no {'/'.join(SOURCE_EXTS)} exports")
+        return sites
+    if DATA_SOURCE:
+        return {os.path.splitext(os.path.basename(DATA_SOURCE))[0]: DATA_SOURCE}
+    names = os.environ.get("ENTRY_FLOW_SITES", "Jockey Plaza").split(",")
+    return {name.strip(): None for name in names if name.strip()}
+
+SITES        = _discover_sites()
+SITE_NAMES   = list(SITES)
+DEFAULT_SITE = SITE_NAMES[0]
+
+def _source_axes(site):
+    # Axes as the source stands now; only reads its metadata
+    if site == ALL_SITES:
+        return sorted({yr for name in SITE_NAMES for yr in _source_axes(name)[0]}), SITE_NAMES
+    if SITES[site] is None:
+        return YEARS, ACCESS_POINTS
+    _, years, aps = load_source(SITES[site])
+    return years, aps
+
+def site_axes(site=DEFAULT_SITE):
+    """(years, access_points) of a site: its loaded store's, else read from its source."""
+    store = _STORES.get(site)
+    if store is not None:
+        return store["years"], store["access_points"]
+    return _source_axes(site)
+
+# Index maps for the fixed axes; year and access point maps live in each store
+MONTH_IDX = {m: i for i, m in enumerate(MONTHS)}
+TYPE_IDX  = {t: i for i, t in enumerate(ENTRY_TYPES)}
+
+def _with_all(cube):
+    # Extra "All" slot on the gate and type axes: [year, month, ap | All, type | All]
+    ny, nm, na, nt = cube.shape
+    full = np.zeros((ny, nm, na + 1, nt + 1), dtype=np.int64)
+    full[:, :, :na, :nt] = cube
+    full[:, :, na, :nt] = cube.sum(axis=2)
+    full[:, :, :, nt] = full[:, :, :, :nt].sum(axis=3)
+    return full
+
+def build_ytd_index(cube):
+    # Month-axis prefix sums, so any YTD total is a single lookup
+    return np.cumsum(_with_all(cube), axis=1)
+
+def spread_hours(cube, years=None):
+    """Split monthly totals into hourly buckets following a daily visit curve.
+
+    Rounding is cumulative over the year and every month boundary falls on an
+    integer running total, so each month's buckets add up exactly to the cube.
+    """
+    years = YEARS if years is None else years
+    ny, nm, na, nt = cube.shape
+    out = np.zeros((ny, HOURS_PER_YEAR, na, nt), dtype=np.int64)
+    for yi, yr in enumerate(years):
+        edges = _month_starts(yr)
+        hours = np.arange(edges[-1])
+        days  = hours // 24
+        month = np.searchsorted(edges, hours, side="right") - 1
+        weekday = (days + (np.datetime64(f"{yr}-01-01") - np.datetime64("1970-01-05")).astype(int)) % 7
+        x = np.sin((yr * 1000 + days[:, None]) * 9301 + np.arange(na) * 49297) * 233280
+        noise  = 0.85 + 0.3 * (x - np.floor(x))
+        weight = (HOUR_PROFILE[hours % 24] * np.where(weekday >= 5, 1.3, 1.0))[:, None] * noise
+        share  = weight / np.add.reduceat(weight, edges[:-1], axis=0)[month]
+        exact  = cube[yi][month] * share[:, :, None]
+        out[yi, :edges[-1]] = np.diff(np.rint(np.cumsum(exact, axis=0)), axis=0, prepend=0)
+    return out
+
+def synthetic_readings(years=None, n_gates=None, bucket_minutes=60):
+    """Counter readings in export format, one DataFrame per year.
+
+    Built from synthetic_cube() and spread_hours(), so ingesting them gives
+    back the same cube. bucket_minutes must divide an hour or be a whole
+    number of hours that divides a day. Gates are named "Gate 001", … so the
+    ingested (sorted) order matches generation order.
+    """
+    import pandas as pd
+
+    if not (60 % bucket_minutes == 0 or (bucket_minutes % 60 == 0 and 1440 % bucket_minutes == 0)):
+        raise ValueError(f"bucket_minutes={bucket_minutes} must divide 60 or be hours dividing 24")
+    years   = list(YEARS if years is None else years)
+    n_gates = len(ACCESS_POINTS) if n_gates is None else n_gates
+    gates   = [f"Gate {g + 1:03d}" for g in range(n_gates)]
+    cube    = synthetic_cube(years, n_gates)
+    for yi, yr in enumerate(years):
+        n_hours = _month_starts(yr)[-1]
+        hourly  = spread_hours(cube[yi:yi + 1], [yr])[0, :n_hours]
+        if bucket_minutes <= 60:
+            # Even split of each hour; the first (count % k) sub-buckets get one more
+            k = 60 // bucket_minutes
+            counts = hourly[:, None] // k + (np.arange(k)[:, None, None] < hourly[:, None] % k)
+        else:
+            counts = hourly.reshape(-1, bucket_minutes // 60, n_gates, len(ENTRY_TYPES)).sum(axis=1)
+        counts = counts.reshape(-1, n_gates, len(ENTRY_TYPES))
+        n = len(counts)
+        stamps = np.datetime64(f"{yr}-01-01T00:00") + np.arange(n) * np.timedelta64(bucket_minutes, "m")
+        yield pd.DataFrame({
+            "timestamp":    np.repeat(stamps, n_gates * len(ENTRY_TYPES)),
+            "access_point": np.tile(np.repeat(gates, len(ENTRY_TYPES)), n),
+            "entry_type":   np.tile(ENTRY_TYPES, n * n_gates),
+            "count":        counts.ravel(),
+        })
+
+def rollup(buckets, granularity, years=None):
+    """Sum hourly buckets into Day, Week (7-day blocks from Jan 1) or Month slots."""
+    years = YEARS if years is None else years
+    step  = {"Day": 24, "Week": 24 * 7}.get(granularity)
+    out   = np.zeros((buckets.shape[0], ROLLUP_SLOTS[granularity]) + buckets.shape[2:], dtype=np.int64)
+    for yi, yr in enumerate(years):
+        edges  = _month_starts(yr)
+        starts = edges[:-1] if step is None else np.arange(0, edges[-1], step)
+        out[yi, :len(starts)] = np.add.reduceat(buckets[yi, :edges[-1]], starts, axis=0)
+    return out
+
+# ── Shared aggregate store ────────────────────────────────────────────────
+# Each site's cube, YTD index and time rollups live as .npy files under
+# STORE_DIR and are memory-mapped. load_store() is cached per process and per
+# site, so all Streamlit sessions share one mapping, and other replicas on the
+# host share the page cache; adding viewers does not add copies (see
+# benchmarks/session_memory.py). A site's files are only mapped once it is
+# queried, so memory follows the sites in use, and each store is sized by its
+# own gates. Sessions only read; append_counts() is the one writer and updates
+# the files in place. Every file belongs to the store, including its hourly
+# buckets: a source's ingestion cache is copied, never written to.
+STORE_VERSION = 3  # bump when a build step changes what it writes
+STORE_DIR = os.environ.get("ENTRY_FLOW_STORE", os.path.join(tempfile.gettempdir(), "entry_flow_store"))
+
+def _store_key(site, members=None):
+    # members: the site stores an ALL_SITES store sums (default: as the sources stand)
+    path  = SITES.get(site)
+    basis = {
+        "site": site,
+        "source": path and os.path.abspath(path),
+        "stamp": path and os.stat(path).st_mtime_ns,
+        "axes": [*_source_axes(site), MONTHS, ENTRY_TYPES],
+        "version": STORE_VERSION,
+    }
+    if site == ALL_SITES:
+        basis["sites"] = [members[name]["key"] if members else _store_key(name) for name in SITE_NAMES]
+        if members:
+            basis["axes"][0] = _member_years(members)
+    return hashlib.sha1(json.dumps(basis).encode()).hexdigest()[:12]
+
+def _member_years(members):
+    return sorted({yr for store in members.values() for yr in store["years"]})
+
+def _open_npy(name, build):
+    path = os.path.join(STORE_DIR, name + ".npy")
+    if not os.path.exists(path):
+        os.makedirs(STORE_DIR, exist_ok=True)
+        _save_npy(path, build())
+    return np.load(path, mmap_mode="r+")
+
+def _sum_sites(granularity, members):
+    # Each site's gates collapse into one slot of the "All sites" store
+    years = _member_years(members)
+    out = None
+    for si, name in enumerate(SITE_NAMES):
+        store = members[name]
+        part  = store[granularity].sum(axis=2)
+        if out is None:
+            out = np.zeros((len(years), part.shape[1], len(SITE_NAMES), part.shape[2]), dtype=np.int64)
+        out[[years.index(yr) for yr in store["years"]], :, si] = part
+    return out
+
+# Loaded stores by site. A lookup is one dict read, and refresh() replaces
+# entries in a single update, so a reader has either the old store or the new.
+# A store missing from it is opened under its site's lock, so sessions that
+# ask at once wait for one build instead of each writing the same files.
+_STORES = {}
+
+def load_store(site=None):
+    """Aggregate store of one site, or of ALL_SITES; the default site if None."""
+    site  = site or DEFAULT_SITE
+    store = _STORES.get(site)
+    if store is None:
+        with _LOAD_LOCKS.setdefault(site, threading.Lock()):
+            store = _STORES.get(site)
+            if store is None:
+                store = _STORES[site] = _open_store(site)
+    return store
+
+def _open_store(site, members=None):
+    # Map (building on first use) the store for the site's source as it is
+    # now; ALL_SITES sums `members`, the site stores it should cover
+    if BUILD_WORKERS > 1:
+        precompute(SITE_NAMES if site == ALL_SITES else [site])
+    path  = SITES.get(site)
+    stamp = path and os.stat(path).st_mtime_ns
+    if site == ALL_SITES:
+        # Built from the site stores on first use, then mapped on its own, so
+        # cross-site views never touch per-gate data
+        members = members or {name: load_store(name) for name in SITE_NAMES}
+        years, aps = _member_years(members), SITE_NAMES
+        key   = _store_key(site, members)
+        cube  = _open_npy(f"cube-{key}", lambda: _sum_sites("Month", members))
+        hours = _open_npy(f"hour-{key}", lambda: _sum_sites("Hour", members))
+    elif path:
+        # Copy the export's hourly cache, which stays read-only, into the store
+        years, aps = _source_axes(site)
+        key   = _store_key(site)
+        hours = _open_npy(f"hour-{key}", lambda: load_source(path)[0])
+        cube  = _open_npy(f"cube-{key}", lambda: rollup(hours, "Month", years))
+    else:
+        years, aps = _source_axes(site)
+        key   = _store_key(site)
+        cube  = _open_npy(f"cube-{key}", lambda: synthetic_cube(years, len(aps), SITE_NAMES.index(site)))
+        hours = _open_npy(f"hour-{key}", lambda: spread_hours(cube, years))
+    return {
+        "site":     site,
+        "key":      key,
+        # Source mtime the store was built from; refresh() compares it
+        "stamp":    stamp,
+        "years":    years,
+        "access_points": aps,
+        "year_idx": {yr: i for i, yr in enumerate(years)},
+        "ap_idx":   {ap: i for i, ap in enumerate(aps)},
+        "Month": cube,
+        "Week":  _open_npy(f"week-{key}", lambda: rollup(hours, "Week", years)),
+        "Day":   _open_npy(f"day-{key}", lambda: rollup(hours, "Day", years)),
+        "Hour":  hours,
+        "ytd":   _open_npy(f"ytd-{key}", lambda: build_ytd_index(cube)),
+        # Per-year data revision, bumped by append_counts() to re-key cached views
+        "rev":   _open_npy(f"rev-{key}", lambda: np.zeros(len(years), dtype=np.int64)),
+    }
+
+# ── Parallel precompute ───────────────────────────────────────────────────
+# With several sources and years, building the stores dominates a cold start.
+# precompute() reads each source in shares (by Parquet row group) and then
+# fills each site's store one year per task across a process pool; every task
+# writes its own year of preallocated files, so merging is free. The All sites
+# store is summed from the finished site stores when first loaded.
+BUILD_WORKERS = int(os.environ.get("ENTRY_FLOW_WORKERS", "1"))
+_BUILD_LOCK   = threading.Lock()
+
+STORE_SLOTS = {"cube": len(MONTHS), "ytd": len(MONTHS), "week": ROLLUP_SLOTS["Week"],
+               "day": ROLLUP_SLOTS["Day"], "hour": HOURS_PER_YEAR}
+
+def _missing_stores(sites):
+    return [s for s in sites if not os.path.exists(os.path.join(STORE_DIR, f"rev-{_store_key(s)}.npy"))]
+
+def _site_files(site):
+    key   = _store_key(site)
+    names = ["cube", "week", "day", "ytd", "hour"]
+    return {name: os.path.join(STORE_DIR, f"{name}-{key}.npy") for name in names}, key
+
+def _build_site_year(site, yi, paths):
+    """Fill year yi of a site's store files, which the caller has preallocated."""
+    years, aps = _source_axes(site)
+    yr  = years[yi]
+    out = {name: np.load(path, mmap_mode="r+") for name, path in paths.items()}
+    if SITES[site]:
+        hours = load_source(SITES[site])[0][yi:yi + 1]
+        out["cube"][yi], out["hour"][yi] = rollup(hours, "Month", [yr])[0], hours[0]
+    else:
+        cube  = synthetic_cube([yr], len(aps), SITE_NAMES.index(site))
+        hours = spread_hours(cube, [yr])
+        out["cube"][yi], out["hour"][yi] = cube[0], hours[0]
+    out["week"][yi] = rollup(hours, "Week", [yr])[0]
+    out["day"][yi]  = rollup(hours, "Day", [yr])[0]
+    out["ytd"][yi]  = build_ytd_index(out["cube"][yi:yi + 1])[0]
+    for arr in out.values():
+        arr.flush()
+
+def _run_tasks(pool, fn, tasks):
+    if pool is None:
+        return [fn(*args) for args in tasks]
+    return [f.result() for f in [pool.submit(fn, *args) for args in tasks]]
+
+def precompute(sites=None, workers=None):
+    """Build the missing store files of the given sites (default: all of them).
+
+    Work is partitioned by site and year across a ProcessPoolExecutor with
+    `workers` processes (default ENTRY_FLOW_WORKERS); 1 builds in-process.
+    Produces the same files load_store() would build on its own. Returns the
+    number of site stores built.
+    """
+    # One build at a time per process: a session opening one site and another
+    # opening the All sites rollup would otherwise both write that site's files
+    with _BUILD_LOCK:
+        return _precompute(sites, workers or BUILD_WORKERS)
+
+def _precompute(sites, workers):
+    from concurrent.futures import ProcessPoolExecutor
+    from numpy.lib.format import open_memmap
+
+    sites   = [s for s in (sites or SITE_NAMES) if s != ALL_SITES]
+    # Store keys need each source's axes, so exports are read before the check
+    sources = [SITES[s] for s in sites if SITES[s] and _cached_counts(SITES[s]) is None]
+    if not sources and not _missing_stores(sites):
+        return 0
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        # Sources first: every share of every stale export, merged per site
+        parts   = workers if pool else 1
+        shares  = _run_tasks(pool, count_totals,
+                             [(path, CHUNK_ROWS, i, parts) for path in sources for i in range(parts)])
+        for n, path in enumerate(sources):
+            load_counts(path, partials=shares[n * parts:(n + 1) * parts])
+
+        # Then one task per site and year, writing into preallocated files
+        stale = _missing_stores(sites)
+        tasks, finals = [], []
+        os.makedirs(STORE_DIR, exist_ok=True)
+        for site in stale:
+            years, aps = _source_axes(site)
+            paths, key = _site_files(site)
+            tmp = {}
+            for name, path in paths.items():
+                extra = 1 if name == "ytd" else 0  # the YTD index has "All" slots
+                shape = (len(years), STORE_SLOTS[name], len(aps) + extra, len(ENTRY_TYPES) + extra)
+                tmp[name] = _temp_beside(path)
+                open_memmap(tmp[name], mode="w+", dtype=np.int64, shape=shape).flush()
+            tasks += [(site, yi, tmp) for yi in range(len(years))]
+            finals.append((site, key, tmp, paths))
+        _run_tasks(pool, _build_site_year, tasks)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    for site, key, tmp, paths in finals:
+        for name, path in paths.items():
+            os.replace(tmp[name], path)
+        # The rev file goes last, as precompute() takes it to mean the store is complete
+        _save_npy(os.path.join(STORE_DIR, f"rev-{key}.npy"), np.zeros(len(_source_axes(site)[0]), dtype=np.int64))
+    return len(stale)
+
+# ── Background refresh ────────────────────────────────────────────────────
+# A refresher thread polls the source exports every ENTRY_FLOW_REFRESH
+# seconds (0, the default, turns it off). When one has changed, it ingests it
+# and builds the new store files under the new store key, all off the request
+# path, then swaps the new stores into _STORES in one update. Readers keep the
+# store they already hold until then, and the key change in data_rev()
+# re-keys every cached view. The old store's files and snapshot are then
+# deleted. Readings added by append_counts() since the last export are dropped
+# with the old store; the new export is expected to hold them.
+REFRESH_SECONDS = float(os.environ.get("ENTRY_FLOW_REFRESH", "0"))
+
+_REFRESH_LOCK = threading.Lock()
+_REFRESHER    = {"thread": None, "stop": None}
+_REFRESH_STATS = {
+    "interval_s": None, "checks": 0, "swaps": 0, "last_check": None, "last_swap": None,
+    "last_sites": [], "last_build_s": None, "last_error": None,
+}
+
+def stale_sites():
+    """Loaded sites whose source export has changed since their store was built."""
+    return [site for site in SITE_NAMES
+            if SITES[site] and site in _STORES and _STORES[site]["stamp"] != os.stat(SITES[site]).st_mtime_ns]
+
+def refresh():
+    """Rebuild the stores of changed sources and swap them in; returns the swapped sites.
+
+    A loaded All sites store is rebuilt from the new site stores in the same swap.
+    """
+    with _REFRESH_LOCK:
+        _REFRESH_STATS["checks"] += 1
+        _REFRESH_STATS["last_check"] = time.time()
+        stale = stale_sites()
+        if not stale:
+            return []
+        t0 = time.perf_counter()
+        with timing.background("refresh_build"):
+            fresh = {site: _open_store(site) for site in stale}
+            if ALL_SITES in _STORES:
+                members = {name: fresh.get(name) or _STORES[name] for name in SITE_NAMES}
+                fresh[ALL_SITES] = _open_store(ALL_SITES, members)
+        build_s = time.perf_counter() - t0
+        old = [_STORES[site]["key"] for site in fresh if site in _STORES]
+        _STORES.update(fresh)
+
+        # New store keys invalidate the warm-start snapshots; redo them here
+        with timing.background("refresh_snapshot"):
+            for site in fresh:
+                save_snapshot(site)
+        # Sessions still holding an old store keep their mappings after the
+        # unlink; only the disk space goes
+        for key in old:
+            _remove_store_files(key)
+        _REFRESH_STATS.update(swaps=_REFRESH_STATS["swaps"] + 1, last_swap=time.time(),
+                              last_sites=list(fresh), last_build_s=build_s)
+        return list(fresh)
+
+def _remove_store_files(key):
+    for name in os.listdir(STORE_DIR):
+        if name.endswith(f"-{key}.npy") or name == f"snapshot-{key}.json":
+            os.remove(os.path.join(STORE_DIR, name))
+
+def _refresh_loop(interval, stop):
+    while not stop.wait(interval):
+        try:
+            refresh()
+            _REFRESH_STATS["last_error"] = None
+        except Exception as exc:  # keep polling; the old stores stay in service
+            _REFRESH_STATS["last_error"] = f"{type(exc).__name__}: {exc}"
+
+def start_refresher(interval=None):
+    """Start the refresher thread (once per process); returns False when disabled."""
+    interval = REFRESH_SECONDS if interval is None else interval
+    if interval <= 0:
+        return False
+    with _REFRESH_LOCK:
+        if _REFRESHER["thread"] is None or not _REFRESHER["thread"].is_alive():
+            stop = threading.Event()
+            thread = threading.Thread(target=_refresh_loop, args=(interval, stop),
+                                      name="entry-flow-refresh", daemon=True)
+            _REFRESHER.update(thread=thread, stop=stop)
+            _REFRESH_STATS["interval_s"] = interval
+            thread.start()
+    return True
+
+def stop_refresher():
+    if _REFRESHER["stop"] is not None:
+        _REFRESHER["stop"].set()
+        _REFRESHER["thread"].join()
+        _REFRESHER.update(thread=None, stop=None)
+
+def refresh_stats():
+    """The refresher's counters and last build time; timing.summary() has its p50/p95."""
+    return dict(_REFRESH_STATS, running=_REFRESHER["thread"] is not None and _REFRESHER["thread"].is_alive())
+
+def _ap_axis(store, ap):
+    return slice(None) if ap == "All" else store["ap_idx"][ap]
+
+def _type_axis(etype):
+    return slice(None) if etype == "All" else TYPE_IDX[etype]
+
+def _series_idx(store, ap, etype):
+    # (ap, type) of a series in the arrays with "All" slots: ytd, _with_all()
+    return (len(store["access_points"]) if ap == "All" else store["ap_idx"][ap],
+            len(ENTRY_TYPES) if etype == "All" else TYPE_IDX[etype])
+
+@timing.timed
+def get_ap(yr, month, ap, etype, site=None):
+    store = load_store(site)
+    return int(store["Month"][store["year_idx"][yr], MONTH_IDX[month], _ap_axis(store, ap), _type_axis(etype)].sum())
+
+@timing.timed
+def get_ytd(yr, upto, etype="All", ap="All", site=None):
+    store = load_store(site)
+    a, t = _series_idx(store, ap, etype)
+    return int(store["ytd"][store["year_idx"][yr], MONTH_IDX[upto], a, t])
+
+@timing.timed
+def get_monthly(yr, month, etype="All", site=None):
+    return get_ap(yr, month, "All", etype, site)
+
+_APPEND_LOCK = threading.Lock()
+
+def _scatter(store, yi, ai, ti, ts, counts):
+    import pandas as pd
+    day = np.asarray(ts.dayofyear) - 1
+    mi  = np.asarray(ts.month) - 1
+    na, nt = len(store["access_points"]), len(ENTRY_TYPES)
+    np.add.at(store["Hour"],  (yi, day * 24 + np.asarray(ts.hour), ai, ti), counts)
+    np.add.at(store["Day"],   (yi, day, ai, ti), counts)
+    np.add.at(store["Week"],  (yi, day // 7, ai, ti), counts)
+    np.add.at(store["Month"], (yi, mi, ai, ti), counts)
+    # The YTD index holds running totals, so each reading lifts its month
+    # and every later one, for the gate/All × type/All corners
+    cells = pd.Series(counts).groupby([yi, mi, ai, ti]).sum()
+    for (y, m, a, t), c in cells.items():
+        for a_, t_ in ((a, t), (na, t), (a, nt), (na, nt)):
+            store["ytd"][y, m:, a_, t_] += c
+    store["rev"][np.unique(yi)] += 1
+
+@timing.timed
+def append_counts(rows, site=None):
+    """Add live counter readings for one site to the store in place.
+
+    rows is an iterable of (timestamp, access_point, entry_type, count). Each
+    rollup and the YTD index get a scatter-add, so the cost follows the batch
+    size rather than the history. The "All sites" store gets the same
+    readings under the site's slot. Only the touched years get a new
+    revision, which re-keys their cached views; views of other years stay warm.
+    """
+    import pandas as pd
+    site = site or DEFAULT_SITE
+    if site == ALL_SITES:
+        raise ValueError("Readings belong to a single site, not the All sites rollup")
+    rows = list(rows)
+    if not rows:
+        return
+    store  = load_store(site)
+    stamps, aps, types, counts = zip(*rows)
+    ts     = pd.DatetimeIndex(pd.to_datetime(list(stamps)))
+    counts = np.asarray(counts, dtype=np.int64)
+    yi = pd.Index(store["years"]).get_indexer(ts.year)
+    ai = pd.Index(store["access_points"]).get_indexer(list(aps))
+    ti = pd.Index(ENTRY_TYPES).get_indexer(list(types))
+    if (yi < 0).any() or (ai < 0).any() or (ti < 0).any():
+        raise ValueError("Readings fall outside the store's years, access points or entry types; rebuild the store to add them")
+
+    total = load_store(ALL_SITES)
+    with _APPEND_LOCK:
+        _scatter(store, yi, ai, ti, ts, counts)
+        _scatter(total, pd.Index(total["years"]).get_indexer(ts.year),
+                 np.full(len(counts), SITE_NAMES.index(site)), ti, ts, counts)
+
+def data_rev(*years, site=None):
+    """Revision tag for the given years, used as part of cached view keys.
+
+    Leads with the store key, so a store swapped in by refresh() re-keys
+    every view even though its revisions start again from zero.
+    """
+    store = load_store(site)
+    return (store["key"],) + tuple(int(store["rev"][store["year_idx"][yr]]) for yr in years)
+
+@timing.timed
+def get_series(yr, granularity, month, ap="All", etype="All", site=None):
+    """(labels, totals) at the given granularity, read from its own rollup.
+
+    Month and Week cover the whole year; Day and Hour cover the selected month.
+    """
+    store = load_store(site)
+    edges = _month_starts(yr)
+    if granularity == "Month":
+        lo, hi, labels = 0, len(MONTHS), MONTHS
+    elif granularity == "Week":
+        lo, hi = 0, -(-edges[-1] // (24 * 7))
+        labels = [f"W{w + 1}" for w in range(hi)]
+    else:
+        mi = MONTH_IDX[month]
+        lo, hi = edges[mi], edges[mi + 1]
+        if granularity == "Day":
+            lo, hi = lo // 24, hi // 24
+            labels = [str(d + 1) for d in range(hi - lo)]
+        else:
+            labels = [f"{h // 24 + 1} {h % 24:02d}h" for h in range(hi - lo)]
+    block = store[granularity][store["year_idx"][yr], lo:hi, _ap_axis(store, ap), _type_axis(etype)]
+    return labels, [int(v) for v in block.reshape(hi - lo, -1).sum(axis=1)]
+
+@timing.timed
+def get_range_series(granularity, start=None, end=None, ap="All", etype="All", site=None):
+    """(timestamps, totals) across every year of the site at Day or Hour steps.
+
+    start and end (dates, inclusive) clip the range. Padding slots past the
+    end of non-leap years are dropped, so the timeline is continuous.
+    """
+    store = load_store(site)
+    per_day = 1 if granularity == "Day" else 24
+    xs, ys = [], []
+    for yi, yr in enumerate(store["years"]):
+        n = _month_starts(yr)[-1] * per_day // 24
+        block = store[granularity][yi, :n, _ap_axis(store, ap), _type_axis(etype)]
+        ys.append(block.reshape(n, -1).sum(axis=1))
+        xs.append(np.datetime64(f"{yr}-01-01", "D" if per_day == 1 else "h") + np.arange(n))
+    x, y = np.concatenate(xs), np.concatenate(ys)
+    keep = np.ones(len(x), dtype=bool)
+    if start is not None:
+        keep &= x >= np.datetime64(start, "D")
+    if end is not None:
+        keep &= x < np.datetime64(end, "D") + np.timedelta64(1, "D")
+    return x[keep], y[keep]
+
+def _first_in_bucket(hits, edges):
+    # Index of the first True in each bucket [edges[i], edges[i + 1])
+    at = np.flatnonzero(hits)
+    return at[np.r_[True, np.diff(np.searchsorted(edges, at, "right")) != 0]]
+
+def downsample(x, y, points):
+    """At most `points` samples by min/max bucketing; a bucket keeps its extremes in time order.
+
+    Unlike averaging, spikes and dips survive, so the line keeps its envelope.
+    """
+    n = len(y)
+    if n <= points:
+        return x, y
+    # points // 2 buckets whose sizes differ by at most one, so the budget is
+    # filled; with a budget of one, the single bucket keeps only its peak
+    k     = max(points // 2, 1)
+    edges = np.arange(k + 1) * n // k
+    sizes = np.diff(edges)
+    hi    = _first_in_bucket(y == np.repeat(np.maximum.reduceat(y, edges[:-1]), sizes), edges)
+    lo    = _first_in_bucket(y == np.repeat(np.minimum.reduceat(y, edges[:-1]), sizes), edges)
+    pick  = np.unique(np.r_[lo, hi] if points > 1 else hi)
+    return x[pick], y[pick]
+
+def calc_pct(a, b): return round((a - b) / b * 100, 1) if b else 0.0
+
+
+# ── Date ranges ───────────────────────────────────────────────────────────
+# Day-axis prefix sums over a site's whole timeline, leap padding dropped and
+# "All" slots included: [day, ap | All, type | All]. Any [start, end) total
+# is then the difference of two rows, whatever the length of the window.
+# After append_counts() the sums are redone from the first moved year only.
+_RANGE      = {}
+_RANGE_LOCK = threading.Lock()
+
+def range_index(site=None):
+    """(first day, prefix sums) over the site's continuous daily timeline."""
+    store = load_store(site)
+    with _RANGE_LOCK:
+        state = _RANGE.get(store["site"])
+        rev   = np.array(store["rev"])
+        if state is not None and state["key"] != store["key"]:
+            state = None  # swapped in by refresh()
+        moved = np.flatnonzero(rev != state["rev"]) if state is not None else [0]
+        if len(moved):
+            days = [_month_starts(yr)[-1] // 24 for yr in store["years"]]
+            if state is None:
+                shape = (sum(days) + 1, len(store["access_points"]) + 1, len(ENTRY_TYPES) + 1)
+                state = _RANGE[store["site"]] = {
+                    "key":   store["key"],
+                    "first": np.datetime64(f"{store['years'][0]}-01-01", "D"),
+                    "cum":   np.zeros(shape, dtype=np.int64),
+                }
+            # Redo the sums in a copy and swap it in: a reader that already
+            # took the array never sees rows without their year's offset
+            cum = state["cum"].copy()
+            lo  = sum(days[:moved[0]])
+            for yi in range(moved[0], len(days)):
+                daily = _with_all(store["Day"][yi:yi + 1, :days[yi]])[0]
+                np.cumsum(daily, axis=0, out=cum[lo + 1:lo + days[yi] + 1])
+                cum[lo + 1:lo + days[yi] + 1] += cum[lo]
+                lo += days[yi]
+            state["cum"], state["rev"] = cum, rev
+        return state["first"], state["cum"]
+
+def _day_offset(first, cum, day):
+    return int(np.clip((np.datetime64(day, "D") - first).astype(int), 0, len(cum) - 1))
+
+def range_bounds(site=None):
+    """(first day, day after the last reading) of a site, as datetime64[D]."""
+    first, cum = range_index(site)
+    return first, first + int(np.searchsorted(cum[:, -1, -1], cum[-1, -1, -1]))
+
+@timing.timed
+def get_range(start, end, ap="All", etype="All", site=None):
+    """Total over the days [start, end); days outside the store count as zero."""
+    store = load_store(site)
+    first, cum = range_index(site)
+    a, t = _series_idx(store, ap, etype)
+    lo, hi = _day_offset(first, cum, start), _day_offset(first, cum, end)
+    return int(cum[max(lo, hi), a, t] - cum[lo, a, t])
+
+def range_view(start1, end1, start2, end2, chart_ap="All", chart_type="All", site=None):
+    """Sections 1–3 of the dashboard for two [start, end) windows.
+
+    Same shape as view_model()'s ytd, categories and bars, with "daily" (mean
+    per day) in place of the monthly card. Bars hold the windows under "p1"
+    and "p2"; z-scores are 0 since the baseline is monthly.
+    """
+    site_aps = site_axes(site or DEFAULT_SITE)[1]
+    aps  = site_aps if chart_ap == "All" else [chart_ap]
+    tot1 = get_range(start1, end1, site=site)
+    tot2 = get_range(start2, end2, site=site)
+    n1   = max(int((np.datetime64(end1, "D") - np.datetime64(start1, "D")).astype(int)), 1)
+    n2   = max(int((np.datetime64(end2, "D") - np.datetime64(start2, "D")).astype(int)), 1)
+    return {
+        "ytd":        (tot1, tot2),
+        "daily":      (round(tot1 / n1), round(tot2 / n2)),
+        "categories": {t: (get_range(start1, end1, etype=t, site=site), get_range(start2, end2, etype=t, site=site))
+                       for t in ENTRY_TYPES},
+        "bars": [{
+            "gate": ap.replace("Gate ", "G"),
+            "full_name": ap,
+            "p1": get_range(start1, end1, ap, chart_type, site),
+            "p2": get_range(start2, end2, ap, chart_type, site),
+            "color_idx": site_aps.index(ap),
+            "z1": 0.0,
+            "z2": 0.0,
+        } for ap in aps],
+    }
+
+
+# ── Anomaly detection ─────────────────────────────────────────────────────
+# Every gate × type series (and the All rollups) is modelled at once as a
+# yearly level times a seasonal shape per month. A point is flagged when its
+# residual is more than Z_THRESHOLD robust sigmas off, e.g. a closed gate or
+# an event spike. Each year is scored against a season fitted on the other
+# years, so a year's own noise (or event) never sets its baseline. The
+# baseline is fitted once per store; after append_counts() only the years
+# whose revision moved are re-scored.
+Z_THRESHOLD = float(os.environ.get("ENTRY_FLOW_ANOMALY_Z", "3.5"))
+
+def _observed(full):
+    # A month counts once the site has any reading in it, so months not reached
+    # yet (the rest of the current year) are neither fitted nor flagged
+    return full[:, :, -1, -1] > 0
+
+def _expected(full, observed, season):
+    # season is one shape for every year, or one per year
+    obs    = observed[:, :, None, None]
+    season = np.broadcast_to(season, full.shape)
+    level  = (np.where(obs, full, 0).sum(axis=1)
+              / np.maximum(np.where(obs, season, 0).sum(axis=1), 1e-9))
+    return level[:, None] * season
+
+def _season(full, observed):
+    # Median over years of each month's share of its year's mean month; flat
+    # for series, months or a cube with no data
+    counts = np.where(observed[:, :, None, None], full, np.nan)
+    with warnings.catch_warnings():
+        # Series or months with no data at all are all-NaN slices here
+        warnings.simplefilter("ignore", RuntimeWarning)
+        season = np.nanmedian(counts / np.nanmean(counts, axis=1, keepdims=True), axis=0)
+    return np.where(np.isfinite(season), season, 1.0)
+
+def _held_out_seasons(full, observed):
+    # Each year's season fitted on the other years only (flat with no others)
+    years = np.arange(len(full))
+    return np.stack([_season(full[years != y], observed[years != y]) for y in years])
+
+def fit_baseline(cube, held_out=False):
+    """(season, scale) for every series of a (year, month, gate, type) cube.
+
+    season is the median over years of each month's share of its year's mean
+    month; scale is the robust sigma (1.4826 × MAD) per series of each
+    year's residuals against the season fitted without that year, so it
+    includes the error of estimating the season, not just in-sample noise.
+    With held_out, season has a year axis too: each year's held-out season.
+    """
+    full = _with_all(cube).astype(float)
+    observed = _observed(full)
+    held  = _held_out_seasons(full, observed)
+    resid = np.where(observed[:, :, None, None], full - _expected(full, observed, held), np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        scale = 1.4826 * np.nanmedian(np.abs(resid - np.nanmedian(resid, axis=(0, 1))), axis=(0, 1))
+    return held if held_out else _season(full, observed), np.where(np.isfinite(scale), scale, 0.0)
+
+def score(cube, season, scale):
+    """Robust z-scores of a cube's series against a fitted baseline; 0 where unobserved."""
+    full = _with_all(cube).astype(float)
+    observed = _observed(full)
+    expected = _expected(full, observed, season)
+    # Never tighter than the Poisson noise of the expected count
+    sigma = np.maximum(scale, np.sqrt(np.maximum(expected, 1.0)))
+    return np.where(observed[:, :, None, None], (full - expected) / sigma, 0.0)
+
+_ANOMALY      = {}
+_ANOMALY_LOCK = threading.Lock()
+
+def anomalies(site=None):
+    """z-scores shaped [year, month, ap | All, type | All] for a site's store."""
+    store = load_store(site)
+    with _ANOMALY_LOCK:
+        state = _ANOMALY.get(store["site"])
+        rev   = np.array(store["rev"])
+        if state is None or state["key"] != store["key"]:
+            season, scale = fit_baseline(store["Month"], held_out=True)
+            # The scale is itself an estimate from the observed months (MAD is
+            # ~37% efficient): widen it by one standard error, so a scale that
+            # comes out low doesn't flag clean months
+            n     = int(_observed(_with_all(store["Month"])).sum())
+            scale = scale * (1 + 1 / np.sqrt(0.74 * max(n, 1)))
+            state = _ANOMALY[store["site"]] = {
+                "key": store["key"], "season": season, "scale": scale, "rev": rev,
+                "z": score(store["Month"], season, scale),
+            }
+        else:
+            moved = np.flatnonzero(rev != state["rev"])
+            if moved.size:
+                state["z"][moved] = score(store["Month"][moved], state["season"][moved], state["scale"])
+                state["rev"] = rev
+        return state["z"]
+
+@timing.timed
+def get_anomaly(yr, month, ap="All", etype="All", site=None):
+    """z-score of one month of a series; |z| > Z_THRESHOLD is flagged."""
+    store = load_store(site)
+    a, t = _series_idx(store, ap, etype)
+    return round(float(anomalies(site)[store["year_idx"][yr], MONTH_IDX[month], a, t]), 2)
+
+
+# ── Forecast ──────────────────────────────────────────────────────────────
+# The rest of a year is projected with the same level × seasonal-shape model,
+# fitted on the years before it: the shape and residual scale come from
+# history, the level from the months so far. The band adds the error of the
+# shape and of the level to the residual noise; on synthetic data it holds
+# about 94% of later months and 93% of full-year totals (see
+# tests/test_entry_flow.py). Fitted parameters are kept per (site, year) and
+# refit only when a history year's revision moves.
+FORECAST_Z = 1.96  # half-width of the band in sigmas (~95% if residuals were normal)
+
+_FORECAST      = {}
+_FORECAST_LOCK = threading.Lock()
+
+def forecast_params(yr, site=None):
+    """(season, scale) for every series, fitted on the site's years before yr.
+
+    Raises ValueError for the site's first year: with no earlier year there
+    is neither a seasonal shape nor a residual scale to size the band with.
+    """
+    store = load_store(site)
+    prior = [i for i, y in enumerate(store["years"]) if y < yr]
+    if not prior:
+        raise ValueError(f"{yr} is the first year of the {store['site']} store; a forecast needs an earlier year")
+    rev   = [store["key"]] + [int(store["rev"][i]) for i in prior]
+    with _FORECAST_LOCK:
+        hit = _FORECAST.get((store["site"], yr))
+        if hit is None or hit[0] != rev:
+            season, scale = fit_baseline(store["Month"][prior])
+            # The projection's own season has an error too, which shrinks
+            # with the number of years it is fitted on
+            scale = scale * np.sqrt(1 + 1 / len(prior))
+            hit = _FORECAST[(store["site"], yr)] = (rev, season, scale)
+        return hit[1], hit[2]
+
+@timing.timed
+def get_forecast(yr, upto, ap="All", etype="All", site=None):
+    """Projection of yr after month `upto`, from its months up to and including it.
+
+    Returns {"projected", "low", "high"}, lists over MONTHS with None up to
+    `upto`, and {"total", "total_low", "total_high"} for the full year
+    (actual YTD plus the projection). Raises ValueError for the site's
+    first year, which has no history to fit on.
+    """
+    store = load_store(site)
+    season, scale = forecast_params(yr, site)
+    a, t = _series_idx(store, ap, etype)
+    mi = MONTH_IDX[upto]
+    actual = np.diff(store["ytd"][store["year_idx"][yr], :, a, t], prepend=0).astype(float)
+    shape  = season[:, a, t]
+    known  = np.arange(len(MONTHS)) <= mi
+    known &= _observed(_with_all(store["Month"][[store["year_idx"][yr]]]))[0]
+    k      = max(int(known.sum()), 1)
+    level  = actual[known].sum() / max(shape[known].sum(), 1e-9)
+    proj   = level * shape
+    # Residual noise per month, widened for the level estimated from k months;
+    # level error is shared by every month, so it adds linearly in the total
+    sigma  = np.maximum(scale[a, t], np.sqrt(np.maximum(proj, 1.0)))
+    ahead  = np.arange(len(MONTHS)) > mi
+    band   = FORECAST_Z * sigma * np.sqrt(1 + 1 / k)
+    spread = FORECAST_Z * np.sqrt((sigma[ahead] ** 2).sum() + sigma[ahead].sum() ** 2 / k)
+    total  = actual[~ahead].sum() + proj[ahead].sum()
+    return {
+        "projected": [round(float(v)) if f else None for v, f in zip(proj, ahead)],
+        "low":       [round(float(max(v - b, 0))) if f else None for v, b, f in zip(proj, band, ahead)],
+        "high":      [round(float(v + b)) if f else None for v, b, f in zip(proj, band, ahead)],
+        "total":      round(float(total)),
+        "total_low":  round(float(max(total - spread, actual[~ahead].sum()))),
+        "total_high": round(float(total + spread)),
+    }
+
+
+# ── Multi-year comparison ─────────────────────────────────────────────────
+# Every year against every other, for every gate × type series at once: the
+# YTD slice of the store is broadcast against itself, so adding years grows
+# one array rather than the number of calc_pct() calls.
+def pct_change(v1, v2):
+    """calc_pct() over arrays; 0 where v2 is 0."""
+    v1 = np.asarray(v1, dtype=float)
+    v2 = np.asarray(v2, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(v2 != 0, np.round((v1 - v2) / np.where(v2 != 0, v2, 1) * 100, 1), 0.0)
+
+@timing.timed
+def growth_matrix(month, site=None):
+    """YTD totals through month and their pairwise growth across the site's years.
+
+    "ytd" is [year, ap | All, type | All]; "pct"[i, j] is year i against year j
+    for every series, so the consecutive YoY steps are its first subdiagonal.
+    """
+    store = load_store(site)
+    ytd   = np.asarray(store["ytd"][:, MONTH_IDX[month]])
+    return {
+        "years":         list(store["years"]),
+        "access_points": list(store["access_points"]) + ["All"],
+        "entry_types":   ENTRY_TYPES + ["All"],
+        "ytd":           ytd,
+        "pct":           pct_change(ytd[:, None], ytd[None, :]),
+    }
+
+@timing.timed
+def year_trends(years, site=None):
+    """Monthly site totals for each of years, as a [year, month] array."""
+    store = load_store(site)
+    yi    = [store["year_idx"][yr] for yr in years]
+    return np.asarray(store["Month"][yi]).sum(axis=(2, 3))
+
+
+# ── View models ───────────────────────────────────────────────────────────
+def default_selection(site=None):
+    """(year1, year2, month, chart_ap, chart_type) the dashboard opens with."""
+    years = site_axes(site or DEFAULT_SITE)[0]
+    year1 = 2026 if 2026 in years else years[-1]
+    rest  = [yr for yr in years if yr != year1]
+    return year1, 2024 if 2024 in rest else rest[0], MONTHS[0], "All", "All"
+
+def view_model(year1, year2, month, chart_ap="All", chart_type="All", site=None):
+    """Every number the dashboard renders for one selection."""
+    site_aps = site_axes(site or DEFAULT_SITE)[1]
+    aps    = site_aps if chart_ap == "All" else [chart_ap]
+    trend1 = [get_monthly(year1, m, site=site) for m in MONTHS]
+    trend2 = [get_monthly(year2, m, site=site) for m in MONTHS]
+    return {
+        "ytd":        (get_ytd(year1, month, site=site), get_ytd(year2, month, site=site)),
+        "monthly":    (get_monthly(year1, month, site=site), get_monthly(year2, month, site=site)),
+        "categories": {t: (get_ytd(year1, month, t, site=site), get_ytd(year2, month, t, site=site))
+                       for t in ENTRY_TYPES},
+        "bars": [{
+            "gate": ap.replace("Gate ", "G"),
+            "full_name": ap,
+            str(year1): get_ap(year1, month, ap, chart_type, site),
+            str(year2): get_ap(year2, month, ap, chart_type, site),
+            "color_idx": site_aps.index(ap),
+            "z1": get_anomaly(year1, month, ap, chart_type, site),
+            "z2": get_anomaly(year2, month, ap, chart_type, site),
+        } for ap in aps],
+        "trend":  (trend1, trend2),
+        "trend_z": ([get_anomaly(year1, m, site=site) for m in MONTHS],
+                    [get_anomaly(year2, m, site=site) for m in MONTHS]),
+        "deltas": [calc_pct(v1, v2) for v1, v2 in zip(trend1, trend2)],
+    }
+
+# ── Warm-start snapshot ───────────────────────────────────────────────────
+# The stores already persist; what a new process still computes for its first
+# visitor is the default page. `entry_flow.py precompute` (or the first
+# request that finds none) saves the default selection's view model next to
+# each store, tagged with the store key and data revisions it was built from.
+# A snapshot whose version, store or revisions differ is ignored and rebuilt.
+SNAPSHOT_VERSION = 3  # bump when the view model or its scores change
+
+def _snapshot_path(site):
+    return os.path.join(STORE_DIR, f"snapshot-{load_store(site)['key']}.json")
+
+def _snapshot_tag(site):
+    store = load_store(site)
+    return {"version": SNAPSHOT_VERSION, "store": store["key"], "rev": store["rev"].tolist()}
+
+@functools.cache
+def _read_snapshot(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+def save_snapshot(site=None, view=None):
+    """Save the view model of site's default selection; built here unless given."""
+    site = site or DEFAULT_SITE
+    selection = default_selection(site)
+    data = {
+        "tag": _snapshot_tag(site),
+        "selection": list(selection),
+        "view": view if view is not None else view_model(*selection, site=site),
+    }
+    path = _snapshot_path(site)
+    os.makedirs(STORE_DIR, exist_ok=True)
+    tmp  = _temp_beside(path)
+    with open(tmp, "w") as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)
+    _read_snapshot.cache_clear()
+
+def snapshot_view(year1, year2, month, chart_ap="All", chart_type="All", site=None):
+    """The saved view model if the snapshot covers this selection and is current, else None."""
+    site = site or DEFAULT_SITE
+    snap = _read_snapshot(_snapshot_path(site))
+    if (not isinstance(snap, dict) or snap.get("tag") != _snapshot_tag(site)
+            or snap.get("selection") != [year1, year2, month, chart_ap, chart_type]):
+        return None
+    return snap["view"]
+
+
+# ── Batch queries / CLI ───────────────────────────────────────────────────
+YOY_FIELDS = ["site", "year1", "year2", "month", "access_point", "entry_type",
+              "value1", "value2", "diff", "pct", "ytd1", "ytd2", "ytd_diff", "ytd_pct"]
+
+def yoy_rows(year1, year2, months=None, access_points=None, entry_types=None, site=None):
+    """Monthly and YTD comparison rows for every month × gate × type combination.
+
+    Filters default to everything, including the "All" rollups. Values come
+    straight from the YTD index: a month's total is the step between two
+    prefix sums.
+    """
+    store         = load_store(site)
+    months        = months or MONTHS
+    access_points = access_points or ["All"] + store["access_points"]
+    entry_types   = entry_types or ["All"] + ENTRY_TYPES
+    ytd     = store["ytd"][[store["year_idx"][year1], store["year_idx"][year2]]]
+    monthly = np.diff(ytd, axis=1, prepend=0)
+    for m, ap, et in itertools.product(months, access_points, entry_types):
+        mi   = MONTH_IDX[m]
+        a, t = _series_idx(store, ap, et)
+        v1, v2 = int(monthly[0, mi, a, t]), int(monthly[1, mi, a, t])
+        y1, y2 = int(ytd[0, mi, a, t]), int(ytd[1, mi, a, t])
+        yield {
+            "site": store["site"], "year1": year1, "year2": year2, "month": m, "access_point": ap, "entry_type": et,
+            "value1": v1, "value2": v2, "diff": v1 - v2, "pct": calc_pct(v1, v2),
+            "ytd1": y1, "ytd2": y2, "ytd_diff": y1 - y2, "ytd_pct": calc_pct(y1, y2),
+        }
+
+# ── Export ────────────────────────────────────────────────────────────────
+# Exports are written chunk by chunk straight to a file, so only one chunk of
+# rows is ever held as a DataFrame. Parquet needs pyarrow and XLSX openpyxl,
+# both imported only when used.
+EXPORT_MIME = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+VIEW_FIELDS = ["site", "section", "item", "year1", "year2", "value1", "value2", "diff", "pct"]
+
+def view_rows(view, year1, year2, month, site=None):
+    """Rows behind Sections 1–4 for one view model: YTD, categories, bars and trend.
+
+    For a range_view(), year1 and year2 are the period labels and month is
+    unused: the rows are the periods' totals, daily means, categories and bars.
+    """
+    site = site or DEFAULT_SITE
+
+    def row(section, item, v1, v2):
+        return {"site": site, "section": section, "item": item, "year1": year1, "year2": year2,
+                "value1": v1, "value2": v2, "diff": v1 - v2, "pct": calc_pct(v1, v2)}
+    periods = "daily" in view
+    if periods:
+        yield row("totals", "Entries", *view["ytd"])
+        yield row("totals", "Daily average", *view["daily"])
+    else:
+        yield row("ytd", f"Jan–{month}", *view["ytd"])
+        yield row("ytd", month, *view["monthly"])
+    for cat, (v1, v2) in view["categories"].items():
+        yield row("categories", cat, v1, v2)
+    k1, k2 = ("p1", "p2") if periods else (str(year1), str(year2))
+    for bar in view["bars"]:
+        yield row("bars", bar["full_name"], bar[k1], bar[k2])
+    if not periods:
+        for m, v1, v2 in zip(MONTHS, *view["trend"]):
+            yield row("trend", m, v1, v2)
+
+def iter_detail(site=None):
+    """The store's hourly buckets as export rows (COUNT_COLUMNS), one month per chunk.
+
+    Empty buckets are skipped; the output can be ingested again as a source.
+    """
+    import pandas as pd
+    store = load_store(site)
+    aps   = np.asarray(store["access_points"])
+    types = np.asarray(ENTRY_TYPES)
+    for yi, yr in enumerate(store["years"]):
+        edges = _month_starts(yr)
+        for lo, hi in zip(edges[:-1], edges[1:]):
+            block = np.asarray(store["Hour"][yi, lo:hi])
+            h, a, t = np.nonzero(block)
+            if len(h):
+                yield pd.DataFrame({
+                    "timestamp":    np.datetime64(f"{yr}-01-01T00", "h") + (lo + h),
+                    "access_point": aps[a],
+                    "entry_type":   types[t],
+                    "count":        block[h, a, t],
+                })
+
+def export(chunks, fmt, path):
+    """Write DataFrame chunks to path as csv, parquet or xlsx.
+
+    Chunks that carry a "section" column go to one XLSX sheet per section.
+    """
+    if fmt == "csv":
+        with open(path, "w", newline="") as fh:
+            for i, df in enumerate(chunks):
+                df.to_csv(fh, header=not i, index=False)
+    elif fmt == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ImportError("Parquet export requires pyarrow") from exc
+        writer = None
+        try:
+            for df in chunks:
+                table  = pa.Table.from_pandas(df, preserve_index=False)
+                writer = writer or pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    elif fmt == "xlsx":
+        import pandas as pd
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError as exc:
+            raise ImportError("XLSX export requires openpyxl") from exc
+        rows = {}
+        with pd.ExcelWriter(path, engine="openpyxl") as xw:
+            for df in chunks:
+                sheet = str(df["section"].iat[0]) if "section" in df and len(df) else "data"
+                df.to_excel(xw, sheet_name=sheet, startrow=rows.get(sheet, 0), header=sheet not in rows, index=False)
+                rows[sheet] = rows.get(sheet, 0) + len(df) + (sheet not in rows)
+    else:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {', '.join(EXPORT_MIME)}")
+
+def export_view(view, year1, year2, month, fmt, path, site=None):
+    """Export the data behind Sections 1–4 for one selection, or for a range_view()."""
+    import pandas as pd
+    rows = list(view_rows(view, year1, year2, month, site))
+    sections = dict.fromkeys(r["section"] for r in rows)
+    export((pd.DataFrame([r for r in rows if r["section"] == s], columns=VIEW_FIELDS) for s in sections), fmt, path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless queries over the visitor entry-flow store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    yoy = sub.add_parser("yoy", help="Compare two years for every month × gate × type")
+    yoy.add_argument("year1", type=int)
+    yoy.add_argument("year2", type=int)
+    yoy.add_argument("--month", dest="months", action="append", choices=MONTHS,
+                     help="Limit to a month (repeatable)")
+    yoy.add_argument("--site", choices=SITE_NAMES + [ALL_SITES], default=DEFAULT_SITE,
+                     help=f"Site to report on (default: {DEFAULT_SITE})")
+    yoy.add_argument("--access-point", dest="access_points", action="append",
+                     help="Limit to an access point of the site, or a site under --site 'All sites' (repeatable)")
+    yoy.add_argument("--entry-type", dest="entry_types", action="append", choices=["All"] + ENTRY_TYPES,
+                     help="Limit to an entry type (repeatable)")
+    yoy.add_argument("--format", choices=["csv", "json"], default="csv")
+    yoy.add_argument("-o", "--output", help="Write to a file instead of stdout")
+    pre = sub.add_parser("precompute", help="Build the aggregate stores ahead of the first request")
+    pre.add_argument("--site", dest="sites", action="append", choices=SITE_NAMES,
+                     help="Limit to a site (repeatable; default: every site and the All sites rollup)")
+    pre.add_argument("--workers", type=int, default=BUILD_WORKERS,
+                     help=f"Build processes (default: ENTRY_FLOW_WORKERS or {BUILD_WORKERS})")
+    exp = sub.add_parser("export", help="Write a site's hourly store as a counts file (timestamp, access_point, entry_type, count)")
+    exp.add_argument("output", help="Output file; the format follows its extension (.csv or .parquet)")
+    exp.add_argument("--site", choices=SITE_NAMES + [ALL_SITES], default=DEFAULT_SITE,
+                     help=f"Site to export (default: {DEFAULT_SITE})")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        fmt = os.path.splitext(args.output)[1].lstrip(".").lower()
+        if fmt not in ("csv", "parquet"):
+            parser.error("export output must end in .csv or .parquet")
+        export(iter_detail(args.site), fmt, args.output)
+        return
+
+    if args.command == "precompute":
+        t0 = time.perf_counter()
+        built = precompute(args.sites, args.workers)
+        for site in args.sites or SITE_NAMES + [ALL_SITES]:
+            save_snapshot(site)
+        print(f"built {built} site store(s) with {args.workers} worker(s) and saved snapshots "
+              f"in {time.perf_counter() - t0:.2f} s")
+        return
+
+    years, aps = site_axes(args.site)
+    for yr in (args.year1, args.year2):
+        if yr not in years:
+            parser.error(f"year {yr} is not in the {args.site} store ({years[0]}–{years[-1]})")
+    for ap in args.access_points or []:
+        if ap != "All" and ap not in aps:
+            parser.error(f"access point {ap!r} is not in the {args.site} store ({', '.join(aps)})")
+
+    rows = yoy_rows(args.year1, args.year2, args.months, args.access_points, args.entry_types, args.site)
+    out  = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            json.dump(list(rows), out, indent=2)
+            out.write("\n")
+        else:
+            writer = csv.DictWriter(out, fieldnames=YOY_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        out.flush()
+    except BrokenPipeError:
+        # The reader stopped early (`| head`): exit quietly. stdout now points
+        # at devnull, so the interpreter's flush at exit doesn't raise again
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
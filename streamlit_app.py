@@ -4,13 +4,27 @@ Tema claro, diseño moderno con datos sintéticos.
 Run: streamlit run streamlit_app.py
 """
 
-import math
+import datetime
+import importlib.util
+import itertools
+import os
+import tempfile
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
 
+import timing
+from entry_flow import (
+    ALL_SITES, DEFAULT_SITE, ENTRY_TYPES, GRANULARITIES, MONTHS, SITE_NAMES,
+    calc_pct, data_rev, default_selection, get_series, save_snapshot, site_axes,
+    downsample, get_forecast, get_range_series, snapshot_view, view_model, Z_THRESHOLD,
+    EXPORT_MIME, export, export_view, iter_detail, range_bounds, range_view,
+    growth_matrix, year_trends, refresh_stats, start_refresher,
+)
+
 # ── Page config ───────────────────────────────────────────────────────────
 st.set_page_config(
     page_title="Visitor Entry Flow · YoY",
@@ -18,6 +32,14 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="collapsed",
 )
+timing.start_rerun()
+
+@st.cache_resource
+def refresher():
+    """Start the background store refresher once per server process (ENTRY_FLOW_REFRESH)."""
+    return start_refresher()
+
+refresher()
 
 # ── Global CSS ────────────────────────────────────────────────────────────
 st.markdown("""
@@ -135,68 +157,101 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-# ── Synthetic Data ────────────────────────────────────────────────────────
-MONTHS = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
-ACCESS_POINTS = ["Gate 1","Gate 3","Plaza Vea","Gate 7","Gate 9"]
-YEARS = [2022, 2023, 2024, 2025, 2026]
-
-def _s(n):
-    x = math.sin(n * 9301 + 49297) * 233280
-    return x - math.floor(x)
-
-def _rng(base, variance, seed):
-    return round(base + (_s(seed) - 0.5) * variance * 2)
-
-@st.cache_data
-def build_raw():
-    raw = {}
-    for yr in YEARS:
-        raw[yr] = {}
-        for mi, m in enumerate(MONTHS):
-            raw[yr][m] = {}
-            for ai, ap in enumerate(ACCESS_POINTS):
-                seed = yr * 1000 + mi * 10 + ai
-                f = 1 + (yr - 2022) * 0.08
-                raw[yr][m][ap] = {
-                    "Pedestrian": _rng(round(90000 * f), 25000, seed + 1),
-                    "Car":        _rng(round(40000 * f), 12000, seed + 2),
-                    "Taxi":       _rng(round(18000 * f), 8000,  seed + 3),
-                }
-    return raw
-
-RAW = build_raw()
-
-def get_ap(yr, month, ap, etype):
-    aps   = ACCESS_POINTS if ap == "All" else [ap]
-    types = ["Pedestrian", "Car", "Taxi"] if etype == "All" else [etype]
-    return sum(RAW[yr][month][a][t] for a in aps for t in types)
-
-def get_ytd(yr, upto, etype="All"):
-    idx = MONTHS.index(upto)
-    return sum(get_ap(yr, m, "All", etype) for m in MONTHS[:idx + 1])
-
-def get_monthly(yr, month, etype="All"):
-    return get_ap(yr, month, "All", etype)
-
+# ── View model ────────────────────────────────────────────────────────────
 def fmt_full(n): return f"{n:,}"
 def fmt(n):
     if n >= 1_000_000: return f"{n/1_000_000:.1f}M"
     if n >= 1_000:     return f"{n/1_000:.0f}K"
     return str(n)
-def calc_pct(a, b): return round((a - b) / b * 100, 1) if b else 0.0
+
+# Number of recent selections whose view model is kept (least recently used evicted)
+VIEW_CACHE_SIZE = int(os.environ.get("ENTRY_FLOW_VIEW_CACHE", "64"))
+# Points sent per long-range trace, about the chart's width in pixels
+TREND_POINTS = int(os.environ.get("ENTRY_FLOW_TREND_POINTS", "1600"))
+
+@timing.track_cache
+@st.cache_data(max_entries=VIEW_CACHE_SIZE)
+def build_view(site, year1, year2, month, chart_ap, chart_type, rev=()):
+    """Every number the page renders for one selection, in one memoized object.
+
+    A new process serves the default selection from the warm-start snapshot,
+    and rewrites the snapshot when it is missing or stale.
+    """
+    timing.mark_miss()
+    selection = (year1, year2, month, chart_ap, chart_type)
+    view = snapshot_view(*selection, site=site)
+    if view is None:
+        view = view_model(*selection, site=site)
+        if selection == default_selection(site):
+            save_snapshot(site, view)
+    return view
+
+@timing.track_cache
+@st.cache_data(max_entries=VIEW_CACHE_SIZE)
+def build_forecast(site, year, month, rev=()):
+    """Rest-of-year projection of the site total; rev covers every year of the site."""
+    timing.mark_miss()
+    return get_forecast(year, month, site=site)
+
+@timing.track_cache
+@st.cache_data(max_entries=VIEW_CACHE_SIZE)
+def build_range_view(site, start1, end1, start2, end2, chart_ap, chart_type, rev=()):
+    """Sections 1–3 for two date windows; rev covers every year of the site."""
+    timing.mark_miss()
+    return range_view(start1, end1, start2, end2, chart_ap, chart_type, site)
+
+@timing.track_cache
+@st.cache_data(max_entries=VIEW_CACHE_SIZE)
+def build_growth(site, month, rev=()):
+    """Pairwise YoY growth of every series through month; rev covers every year of the site."""
+    timing.mark_miss()
+    return growth_matrix(month, site)
 
 AP_COLORS = ["#2563EB", "#6366F1", "#F59E0B", "#10B981", "#EF4444"]
+OVERLAY_COLORS = ["#8B5CF6", "#10B981", "#EC4899", "#14B8A6", "#64748B", "#A855F7"]
+GROWTH_SCALE   = [[0, "#DC2626"], [0.5, "#FFFFFF"], [1, "#059669"]]
 CAT_COLORS = {"Pedestrian": "#6366F1", "Car": "#10B981", "Taxi": "#F59E0B"}
 CAT_BG     = {"Pedestrian": "#EEF2FF", "Car": "#ECFDF5",  "Taxi": "#FFFBEB"}
 CAT_ICONS  = {"Pedestrian": "🚶", "Car": "🚗", "Taxi": "🚕"}
 
 
+# ── Export ────────────────────────────────────────────────────────────────
+# Download buttons get a callable, so nothing is written until one is clicked
+def export_file(write, fmt):
+    """Bytes of an entry_flow export, written through a temp file."""
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        write(fmt, path)
+        with open(path, "rb") as fh:
+            return fh.read()
+    finally:
+        os.remove(path)
+
+EXPORT_READY = {
+    "csv":     True,
+    "parquet": importlib.util.find_spec("pyarrow") is not None,
+    "xlsx":    importlib.util.find_spec("openpyxl") is not None,
+}
+
+
 # ── Helpers ───────────────────────────────────────────────────────────────
 def delta_pill(val: float) -> str:
     cls = "pill-pos" if val >= 0 else "pill-neg"
     arrow = "▲" if val >= 0 else "▼"
     return f'<span class="{cls}">{arrow} {abs(val)}%</span>'
 
+def period_label(first: datetime.date, last: datetime.date) -> str:
+    if first.year == last.year:
+        return f"{first.day} {first:%b} – {last.day} {last:%b %Y}"
+    return f"{first.day} {first:%b %Y} – {last.day} {last:%b %Y}"
+
+def years_back(day: datetime.date, n: int) -> datetime.date:
+    try:
+        return day.replace(year=day.year - n)
+    except ValueError:  # 29 Feb
+        return day.replace(year=day.year - n, day=28)
+
 def section_header(icon: str, label: str):
     st.markdown(f"""
     <div class="section-label">
@@ -205,227 +260,116 @@ def section_header(icon: str, label: str):
     </div>""", unsafe_allow_html=True)
 
 
-# ── TOP BAR + HEADER ──────────────────────────────────────────────────────
-st.markdown('<div class="top-bar"></div>', unsafe_allow_html=True)
-
-# Header row with logo + filters
-header_l, header_r = st.columns([3, 2])
-
-with header_l:
-    st.markdown("""
-    <div style="padding: 14px 28px 10px 28px; display:flex; align-items:center; gap:14px;">
-      <div style="background:#EFF6FF; border:1px solid #BFDBFE; border-radius:10px;
-                  padding:7px 11px; text-align:center; line-height:1.2;">
-        <div style="font-size:11px; font-weight:900; color:#2563EB;">JOCKEY</div>
-        <div style="font-size:8px; font-weight:700; color:#2563EB; letter-spacing:.05em;">PLAZA</div>
-      </div>
-      <div>
-        <div style="font-size:18px; font-weight:900; color:#111827; letter-spacing:-0.02em; line-height:1;">
-          VISITOR ENTRY FLOW
-        </div>
-        <div style="font-size:11px; color:#6B7280; margin-top:3px; font-weight:500;">
-          Year-over-Year Comparison &nbsp;·&nbsp; By Access Point
+# ── HTML blocks ───────────────────────────────────────────────────────────
+# Sections made of many small cards are rendered from these templates into a
+# single markdown element, cached per input tuple, so a rerun sends one
+# element per section instead of one per card and column.
+CAT_CARD_HTML = """<div class="cat-card">
+  <div style="height:4px; background:{clr};"></div>
+  <div style="padding:16px 20px;">
+    <div style="display:flex; justify-content:space-between; align-items:flex-start; margin-bottom:14px;">
+      <div style="display:flex; align-items:center; gap:8px;">
+        <span style="font-size:22px;">{icon}</span>
+        <div>
+          <div style="font-size:11px;font-weight:700;color:#111827;text-transform:uppercase;letter-spacing:.07em;">{cat}</div>
+          <div style="font-size:10px;color:#9CA3AF;margin-top:1px;">{pct_of}% of total YTD</div>
         </div>
       </div>
+      {pill}
     </div>
-    """, unsafe_allow_html=True)
-
-with header_r:
-    st.markdown('<div style="height:10px;"></div>', unsafe_allow_html=True)
-    fc1, fc2, fc3 = st.columns(3)
-    with fc1:
-        year1 = st.selectbox("Year 1", [y for y in YEARS], index=YEARS.index(2026), key="year1")
-    with fc2:
-        yr2_opts = [y for y in YEARS if y != year1]
-        year2 = st.selectbox("Year 2", yr2_opts, index=yr2_opts.index(2024) if 2024 in yr2_opts else 0, key="year2")
-    with fc3:
-        month = st.selectbox("Month", MONTHS, index=0, key="month")
-
-st.markdown('<div style="height:2px; background:#E8EAF0; margin: 0 0 20px 0;"></div>', unsafe_allow_html=True)
-
-# ── Pre-compute values ────────────────────────────────────────────────────
-ytd1 = get_ytd(year1, month)
-ytd2 = get_ytd(year2, month)
-mo1  = get_monthly(year1, month)
-mo2  = get_monthly(year2, month)
-
-ped1 = get_ytd(year1, month, "Pedestrian")
-ped2 = get_ytd(year2, month, "Pedestrian")
-car1 = get_ytd(year1, month, "Car")
-car2 = get_ytd(year2, month, "Car")
-tax1 = get_ytd(year1, month, "Taxi")
-tax2 = get_ytd(year2, month, "Taxi")
-tot1 = ped1 + car1 + tax1 or 1
-
-# ── SECTION 1 — YTD + Monthly ─────────────────────────────────────────────
-with st.container():
-    st.markdown('<div style="padding: 0 28px;">', unsafe_allow_html=True)
-    section_header("◈", f"Year-to-Date Entries — Jan through {month}")
-
-    col1, col2 = st.columns(2, gap="medium")
-
-    for col, label, v1, v2, accent in [
-        (col1, f"YTD Entries · Jan – {month}",     ytd1, ytd2, True),
-        (col2, f"Monthly Entries · {month} only",  mo1,  mo2,  False),
-    ]:
-        diff = v1 - v2
-        d    = calc_pct(v1, v2)
-        border_left = "border-left: 4px solid #2563EB;" if accent else ""
-        with col:
-            st.markdown(f"""
-            <div class="metric-card" style="{border_left}">
-              <div class="label-sm">{label}</div>
-              <div style="display:flex; gap:24px; align-items:flex-end; flex-wrap:wrap;">
-                <div>
-                  <div class="yr1-tag" style="margin-bottom:8px;">
-                    <div style="width:6px;height:6px;border-radius:50%;background:#2563EB;"></div>
-                    {year1}
-                  </div>
-                  <div class="big-num" style="color:#111827;">{fmt_full(v1)}</div>
-                </div>
-                <div>
-                  <div class="yr2-tag" style="margin-bottom:8px;">
-                    <div style="width:6px;height:6px;border-radius:50%;background:#F59E0B;"></div>
-                    {year2}
-                  </div>
-                  <div class="big-num-muted">{fmt_full(v2)}</div>
-                </div>
-                <div style="margin-left:auto; text-align:right;">
-                  <div style="font-size:10px;font-weight:600;color:#9CA3AF;text-transform:uppercase;letter-spacing:.07em;margin-bottom:4px;">Difference</div>
-                  <div style="font-size:15px;font-weight:700;color:{'#059669' if diff>=0 else '#DC2626'};margin-bottom:6px;">
-                    {'+'if diff>=0 else ''}{fmt_full(diff)}
-                  </div>
-                  {delta_pill(d)}
-                </div>
-              </div>
-            </div>
-            """, unsafe_allow_html=True)
-
-    st.markdown("</div>", unsafe_allow_html=True)
-
-st.markdown('<div style="height:20px;"></div>', unsafe_allow_html=True)
-
-# ── SECTION 2 — Category Breakdown ────────────────────────────────────────
-with st.container():
-    st.markdown('<div style="padding: 0 28px;">', unsafe_allow_html=True)
-    section_header("◉", "YTD Breakdown by Entry Type")
-
-    cc1, cc2, cc3 = st.columns(3, gap="medium")
-
-    for col, cat, v1, v2 in [
-        (cc1, "Pedestrian", ped1, ped2),
-        (cc2, "Car",        car1, car2),
-        (cc3, "Taxi",       tax1, tax2),
-    ]:
-        d      = calc_pct(v1, v2)
-        clr    = CAT_COLORS[cat]
-        bgclr  = CAT_BG[cat]
-        icon   = CAT_ICONS[cat]
-        pct_of = round(v1 / tot1 * 100, 1)
-
-        with col:
-            st.markdown(f"""
-            <div class="cat-card">
-              <div style="height:4px; background:{clr};"></div>
-              <div style="padding:16px 20px;">
-                <div style="display:flex; justify-content:space-between; align-items:flex-start; margin-bottom:14px;">
-                  <div style="display:flex; align-items:center; gap:8px;">
-                    <span style="font-size:22px;">{icon}</span>
-                    <div>
-                      <div style="font-size:11px;font-weight:700;color:#111827;text-transform:uppercase;letter-spacing:.07em;">{cat}</div>
-                      <div style="font-size:10px;color:#9CA3AF;margin-top:1px;">{pct_of}% of total YTD</div>
-                    </div>
-                  </div>
-                  {delta_pill(d)}
-                </div>
-                <div style="display:flex; gap:8px;">
-                  <div style="flex:1; background:{bgclr}; border:1px solid #E8EAF0; border-radius:10px; padding:10px 12px;">
-                    <div style="font-size:9px;font-weight:700;color:{clr};text-transform:uppercase;margin-bottom:4px;">{year1}</div>
-                    <div style="font-size:18px;font-weight:800;color:#111827;letter-spacing:-0.02em;">{fmt_full(v1)}</div>
-                  </div>
-                  <div style="flex:1; background:#F9FAFB; border:1px solid #E8EAF0; border-radius:10px; padding:10px 12px;">
-                    <div style="font-size:9px;font-weight:700;color:#9CA3AF;text-transform:uppercase;margin-bottom:4px;">{year2}</div>
-                    <div style="font-size:18px;font-weight:800;color:#9CA3AF;letter-spacing:-0.02em;">{fmt_full(v2)}</div>
-                  </div>
-                </div>
-              </div>
-            </div>
-            """, unsafe_allow_html=True)
-
-    st.markdown("</div>", unsafe_allow_html=True)
-
-st.markdown('<div style="height:20px;"></div>', unsafe_allow_html=True)
-
-# ── SECTION 3 — Bar Chart by Access Point ────────────────────────────────
-with st.container():
-    st.markdown('<div style="padding: 0 28px;">', unsafe_allow_html=True)
-    section_header("◐", "Entries by Access Point")
-
-    st.markdown('<div class="chart-card">', unsafe_allow_html=True)
-
-    fh1, fh2, fh3 = st.columns([3, 1, 1])
-    with fh1:
-        st.markdown(f"""
-        <div>
-          <div style="font-size:14px;font-weight:700;color:#111827;">Monthly Comparison by Gate</div>
-          <div style="font-size:10px;color:#6B7280;margin-top:3px;">{month} · Selected filters apply</div>
-        </div>
-        """, unsafe_allow_html=True)
-    with fh2:
-        chart_ap = st.selectbox("Access Point", ["All"] + ACCESS_POINTS, key="chart_ap")
-    with fh3:
-        chart_type = st.selectbox("Entry Type", ["All", "Pedestrian", "Car", "Taxi"], key="chart_type")
-
-    aps_to_show = ACCESS_POINTS if chart_ap == "All" else [chart_ap]
-    bar_data = []
-    for i, ap in enumerate(aps_to_show):
-        bar_data.append({
-            "gate": ap.replace("Gate ", "G"),
-            "full_name": ap,
-            str(year1): get_ap(year1, month, ap, chart_type),
-            str(year2): get_ap(year2, month, ap, chart_type),
-            "color_idx": ACCESS_POINTS.index(ap),
-        })
-    bar_df = pd.DataFrame(bar_data)
-
-    fig_bar = go.Figure()
-    for _, row in bar_df.iterrows():
-        clr = AP_COLORS[int(row["color_idx"]) % len(AP_COLORS)]
-        fig_bar.add_trace(go.Bar(
-            name=str(year1), x=[row["gate"]], y=[row[str(year1)]],
-            marker_color=clr, marker_line_width=0,
-            showlegend=(_ == bar_df.index[0]),
-            legendgroup="yr1",
-        ))
-        fig_bar.add_trace(go.Bar(
-            name=str(year2), x=[row["gate"]], y=[row[str(year2)]],
-            marker_color=clr, marker_opacity=0.3, marker_line_width=0,
-            showlegend=(_ == bar_df.index[0]),
-            legendgroup="yr2",
+    <div style="display:flex; gap:8px;">
+      <div style="flex:1; background:{bgclr}; border:1px solid #E8EAF0; border-radius:10px; padding:10px 12px;">
+        <div style="font-size:9px;font-weight:700;color:{clr};text-transform:uppercase;margin-bottom:4px;">{year1}</div>
+        <div style="font-size:18px;font-weight:800;color:#111827;letter-spacing:-0.02em;">{v1}</div>
+      </div>
+      <div style="flex:1; background:#F9FAFB; border:1px solid #E8EAF0; border-radius:10px; padding:10px 12px;">
+        <div style="font-size:9px;font-weight:700;color:#9CA3AF;text-transform:uppercase;margin-bottom:4px;">{year2}</div>
+        <div style="font-size:18px;font-weight:800;color:#9CA3AF;letter-spacing:-0.02em;">{v2}</div>
+      </div>
+    </div>
+  </div>
+</div>"""
+
+DELTA_CELL_HTML = """<div style="text-align:center; border-radius:8px; padding:6px 2px;
+            background:{bg}; border:{border}; cursor:pointer;">
+  <div style="font-size:9px; font-weight:{m_fw}; color:{m_color};">{m}</div>
+  <div style="font-size:9px; font-weight:700; color:{d_color}; margin-top:2px;">
+    {arr}{d}%
+  </div>
+</div>"""
+
+@timing.track_cache
+@st.cache_data(max_entries=VIEW_CACHE_SIZE)
+def category_cards_html(year1, year2, categories):
+    timing.mark_miss()
+    tot1  = sum(v1 for v1, _ in categories.values()) or 1
+    cards = [CAT_CARD_HTML.format(
+        cat=cat, clr=CAT_COLORS[cat], bgclr=CAT_BG[cat], icon=CAT_ICONS[cat],
+        pct_of=round(v1 / tot1 * 100, 1), pill=delta_pill(calc_pct(v1, v2)),
+        year1=year1, year2=year2, v1=fmt_full(v1), v2=fmt_full(v2),
+    ) for cat, (v1, v2) in categories.items()]
+    return ('<div style="display:grid; grid-template-columns:repeat(3, 1fr); gap:16px;">'
+            + "".join(cards) + "</div>")
+
+@timing.track_cache
+@st.cache_data(max_entries=VIEW_CACHE_SIZE)
+def delta_row_html(month, deltas):
+    timing.mark_miss()
+    cells = []
+    for m, d in zip(MONTHS, deltas):
+        sel = m == month
+        cells.append(DELTA_CELL_HTML.format(
+            m=m, d=abs(d), arr="▲" if d >= 0 else "▼",
+            bg="#EFF6FF" if sel else "transparent",
+            border="1px solid #BFDBFE" if sel else "1px solid transparent",
+            m_color="#2563EB" if sel else "#6B7280",
+            m_fw="700" if sel else "500",
+            d_color="#059669" if d >= 0 else "#DC2626",
         ))
-
-    # Rebuild with proper legends
+    return ('<div style="border-top:1px solid #E8EAF0; padding-top:12px; margin-top:4px;">'
+            '<div style="display:grid; grid-template-columns:repeat(12, 1fr); gap:8px;">'
+            + "".join(cells) + "</div></div>")
+
+
+# ── Figures ───────────────────────────────────────────────────────────────
+# Built once per distinct input and kept as shared Figure objects, so a rerun
+# with a recently used selection skips trace construction and validation.
+@timing.track_cache
+@st.cache_resource(max_entries=VIEW_CACHE_SIZE)
+def bar_figure(site, year1, year2, month, chart_ap, chart_type, rev=(), ranges=None):
+    """Grouped bars per gate; with ranges (start1, end1, start2, end2) year1/year2 are the period labels."""
+    timing.mark_miss()
+    if ranges:
+        bar_df = pd.DataFrame(build_range_view(site, *ranges, chart_ap, chart_type, rev)["bars"])
+        k1, k2 = "p1", "p2"
+    else:
+        bar_df = pd.DataFrame(build_view(site, year1, year2, month, chart_ap, chart_type, rev)["bars"])
+        k1, k2 = str(year1), str(year2)
+    colors = [AP_COLORS[i % len(AP_COLORS)] for i in bar_df["color_idx"]]
+    # Bars off their seasonal baseline get a red outline and a ⚠ label
+    flag1  = [abs(z) > Z_THRESHOLD for z in bar_df["z1"]]
+    flag2  = [abs(z) > Z_THRESHOLD for z in bar_df["z2"]]
+
+    # One trace per year; per-gate colour comes from the marker arrays
     fig_bar = go.Figure()
-    for i, row in bar_df.iterrows():
-        clr = AP_COLORS[int(row["color_idx"]) % len(AP_COLORS)]
-        fig_bar.add_trace(go.Bar(
-            name=f"{row['full_name']} {year1}",
-            x=[row["gate"]], y=[row[str(year1)]],
-            marker_color=clr, marker_line_width=0,
-            legendgroup=row["gate"],
-            showlegend=(i == bar_df.index[0]),
-            text=[fmt(row[str(year1)])], textposition="outside",
-            textfont=dict(size=10, color=clr, family="Inter"),
-        ))
-        fig_bar.add_trace(go.Bar(
-            name=f"{row['full_name']} {year2}",
-            x=[row["gate"]], y=[row[str(year2)]],
-            marker_color=clr, marker_opacity=0.32, marker_line_width=0,
-            legendgroup=row["gate"],
-            showlegend=False,
-            text=[fmt(row[str(year2)])], textposition="outside",
-            textfont=dict(size=10, color="#9CA3AF", family="Inter"),
-        ))
+    fig_bar.add_trace(go.Bar(
+        name=str(year1), x=bar_df["gate"], y=bar_df[k1],
+        customdata=bar_df["full_name"],
+        marker_color=colors, marker_line_width=[2 if f else 0 for f in flag1],
+        marker_line_color=["#DC2626" if f else c for f, c in zip(flag1, colors)],
+        text=[fmt(v) + (" ⚠" if f else "") for v, f in zip(bar_df[k1], flag1)], textposition="outside",
+        textfont=dict(size=10, color=colors, family="Inter"),
+        hovertemplate=f"<b>%{{customdata}}</b> {year1}: %{{y:,.0f}}<extra></extra>",
+    ))
+    fig_bar.add_trace(go.Bar(
+        name=str(year2), x=bar_df["gate"], y=bar_df[k2],
+        customdata=bar_df["full_name"],
+        marker_color=colors, marker_opacity=0.32, marker_line_width=[2 if f else 0 for f in flag2],
+        marker_line_color=["#DC2626" if f else c for f, c in zip(flag2, colors)],
+        text=[fmt(v) + (" ⚠" if f else "") for v, f in zip(bar_df[k2], flag2)], textposition="outside",
+        textfont=dict(size=10, color="#9CA3AF", family="Inter"),
+        hovertemplate=f"<b>%{{customdata}}</b> {year2}: %{{y:,.0f}}<extra></extra>",
+    ))
 
     fig_bar.update_layout(
         barmode="group", bargap=0.30, bargroupgap=0.06,
@@ -445,60 +389,29 @@ with st.container():
     )
 
     # Custom legend via annotation
+    site_aps    = site_axes(site)[1]
+    aps_to_show = site_aps if chart_ap == "All" else [chart_ap]
     for i, ap in enumerate(aps_to_show):
-        clr = AP_COLORS[ACCESS_POINTS.index(ap) % len(AP_COLORS)]
+        clr = AP_COLORS[site_aps.index(ap) % len(AP_COLORS)]
         fig_bar.add_annotation(
             x=0.0 + i * 0.14, y=1.08, xref="paper", yref="paper",
             text=f"<b>■</b> {ap.replace('Gate ','G')}",
             font=dict(size=10, color=clr, family="Inter"),
             showarrow=False, align="left",
         )
-
-    st.plotly_chart(fig_bar, use_container_width=True, config={"displayModeBar": False})
-    st.markdown("</div>", unsafe_allow_html=True)
-    st.markdown("</div>", unsafe_allow_html=True)
-
-st.markdown('<div style="height:20px;"></div>', unsafe_allow_html=True)
-
-# ── SECTION 4 — Trend Line Chart ──────────────────────────────────────────
-with st.container():
-    st.markdown('<div style="padding: 0 28px;">', unsafe_allow_html=True)
-    section_header("◷", "Monthly Trend Analysis — Full Year")
-
-    st.markdown('<div class="chart-card">', unsafe_allow_html=True)
-
-    st.markdown(f"""
-    <div style="display:flex; justify-content:space-between; align-items:center; margin-bottom:16px;">
-      <div>
-        <div style="font-size:14px;font-weight:700;color:#111827;">Total Entries per Month</div>
-        <div style="font-size:10px;color:#6B7280;margin-top:3px;">
-          Selected month highlighted &nbsp;·&nbsp; Click on the delta row below to change month
-        </div>
-      </div>
-      <div style="display:flex; gap:20px; align-items:center;">
-        <div style="display:flex;align-items:center;gap:6px;">
-          <svg width="32" height="12">
-            <line x1="0" y1="6" x2="32" y2="6" stroke="#2563EB" stroke-width="2.5" stroke-linecap="round"/>
-            <circle cx="16" cy="6" r="4" fill="#2563EB"/>
-          </svg>
-          <span style="font-size:12px;font-weight:700;color:#2563EB;">{year1}</span>
-        </div>
-        <div style="display:flex;align-items:center;gap:6px;">
-          <svg width="32" height="12">
-            <line x1="0" y1="6" x2="32" y2="6" stroke="#F59E0B" stroke-width="2.5"
-              stroke-dasharray="6,3" stroke-linecap="round"/>
-            <circle cx="16" cy="6" r="4" fill="#F59E0B"/>
-          </svg>
-          <span style="font-size:12px;font-weight:700;color:#F59E0B;">{year2}</span>
-        </div>
-      </div>
-    </div>
-    """, unsafe_allow_html=True)
-
+    return fig_bar
+
+@timing.track_cache
+@st.cache_resource(max_entries=VIEW_CACHE_SIZE)
+def trend_figure(site, year1, year2, month, rev=(), forecast=None, overlay=(), overlay_rev=()):
+    """Monthly Y1/Y2 lines; overlay adds thin lines for more years, overlay_rev keys their data."""
+    timing.mark_miss()
+    trend_view     = build_view(site, year1, year2, month, "All", "All", rev)
+    trend1, trend2 = trend_view["trend"]
     trend_data = {
         "month": MONTHS,
-        str(year1): [get_monthly(year1, m) for m in MONTHS],
-        str(year2): [get_monthly(year2, m) for m in MONTHS],
+        str(year1): trend1,
+        str(year2): trend2,
     }
     trend_df = pd.DataFrame(trend_data)
     sel_idx  = MONTHS.index(month)
@@ -513,6 +426,15 @@ with st.container():
         showlegend=False, hoverinfo="skip",
     ))
 
+    # Overlay years, thin and beneath the two compared ones
+    if overlay:
+        for yr, values, color in zip(overlay, year_trends(overlay, site), itertools.cycle(OVERLAY_COLORS)):
+            fig_line.add_trace(go.Scatter(
+                x=MONTHS, y=values, mode="lines", name=str(yr),
+                line=dict(color=color, width=1.5), opacity=0.8,
+                hovertemplate=f"<b>{yr}</b> %{{x}}: %{{y:,.0f}}<extra></extra>",
+            ))
+
     # Y1 line
     fig_line.add_trace(go.Scatter(
         x=MONTHS, y=trend_df[str(year1)],
@@ -541,6 +463,37 @@ with st.container():
         hovertemplate=f"<b>{year2}</b> %{{x}}: %{{y:,.0f}}<extra></extra>",
     ))
 
+    # Projected rest of Y1 with its confidence band, from the selected month on
+    if forecast and any(v is not None for v in forecast["projected"]):
+        ahead = [i for i, v in enumerate(forecast["projected"]) if v is not None]
+        x_fc  = [month] + [MONTHS[i] for i in ahead]
+        fig_line.add_trace(go.Scatter(
+            x=x_fc, y=[trend1[sel_idx]] + [forecast["high"][i] for i in ahead],
+            mode="lines", line=dict(width=0), showlegend=False, hoverinfo="skip",
+        ))
+        fig_line.add_trace(go.Scatter(
+            x=x_fc, y=[trend1[sel_idx]] + [forecast["low"][i] for i in ahead],
+            mode="lines", line=dict(width=0), fill="tonexty",
+            fillcolor="rgba(37,99,235,0.12)", showlegend=False, hoverinfo="skip",
+        ))
+        fig_line.add_trace(go.Scatter(
+            x=x_fc, y=[trend1[sel_idx]] + [forecast["projected"][i] for i in ahead],
+            mode="lines", name=f"{year1} projected",
+            line=dict(color="#2563EB", width=2, dash="dash"),
+            hovertemplate=f"<b>{year1} projected</b> %{{x}}: %{{y:,.0f}}<extra></extra>",
+        ))
+
+    # Red rings on months off their seasonal baseline
+    for yr, values, zs in ((year1, trend1, trend_view["trend_z"][0]), (year2, trend2, trend_view["trend_z"][1])):
+        hits = [i for i, z in enumerate(zs) if abs(z) > Z_THRESHOLD]
+        if hits:
+            fig_line.add_trace(go.Scatter(
+                x=[MONTHS[i] for i in hits], y=[values[i] for i in hits], customdata=[zs[i] for i in hits],
+                mode="markers", showlegend=False,
+                marker=dict(size=16, color="rgba(0,0,0,0)", line=dict(color="#DC2626", width=2)),
+                hovertemplate=f"<b>{yr}</b> %{{x}}: off seasonal baseline (z = %{{customdata:.1f}})<extra></extra>",
+            ))
+
     # Vertical reference line for selected month
     fig_line.add_shape(
         type="line", x0=month, x1=month,
@@ -579,38 +532,504 @@ with st.container():
         ),
         hovermode="x unified",
     )
+    return fig_line
 
-    st.plotly_chart(fig_line, use_container_width=True, config={"displayModeBar": False})
+@timing.track_cache
+@st.cache_resource(max_entries=VIEW_CACHE_SIZE)
+def detail_trend_figure(site, year1, year2, month, granularity, rev=()):
+    timing.mark_miss()
+    # Week/Day/Hour series straight from their rollups; lines only, as these
+    # run to hundreds of points
+    x1, y1 = get_series(year1, granularity, month, site=site)
+    x2, y2 = get_series(year2, granularity, month, site=site)
 
-    # ── Delta month row ───────────────────────────────────────────────────
-    st.markdown('<div style="border-top:1px solid #E8EAF0; padding-top:12px; margin-top:4px;">', unsafe_allow_html=True)
-    delta_cols = st.columns(12)
-    for i, (col, m) in enumerate(zip(delta_cols, MONTHS)):
-        v1_m = get_monthly(year1, m)
-        v2_m = get_monthly(year2, m)
-        d    = calc_pct(v1_m, v2_m)
-        pos  = d >= 0
-        sel  = m == month
+    fig_line = go.Figure()
+    fig_line.add_trace(go.Scatter(
+        x=x1, y=y1, mode="none", fill="tozeroy",
+        fillcolor="rgba(37,99,235,0.07)",
+        showlegend=False, hoverinfo="skip",
+    ))
+    fig_line.add_trace(go.Scatter(
+        x=x1, y=y1, mode="lines", name=str(year1),
+        line=dict(color="#2563EB", width=2),
+        hovertemplate=f"<b>{year1}</b> %{{x}}: %{{y:,.0f}}<extra></extra>",
+    ))
+    fig_line.add_trace(go.Scatter(
+        x=x2, y=y2, mode="lines", name=str(year2),
+        line=dict(color="#F59E0B", width=2, dash="dot"),
+        hovertemplate=f"<b>{year2}</b> %{{x}}: %{{y:,.0f}}<extra></extra>",
+    ))
+    fig_line.update_layout(
+        plot_bgcolor="white", paper_bgcolor="white",
+        height=240, margin=dict(l=0, r=0, t=20, b=10),
+        font=dict(family="Inter", size=11, color="#6B7280"),
+        xaxis=dict(showgrid=False, zeroline=False, showline=False, type="category",
+                   nticks=16, tickfont=dict(size=11, color="#6B7280")),
+        yaxis=dict(showgrid=True, gridcolor="#F3F4F6", zeroline=False,
+                   showline=False, tickfont=dict(size=10, color="#9CA3AF"),
+                   tickformat=",.0f"),
+        showlegend=False,
+        hovermode="x unified",
+    )
+    return fig_line
+
+@timing.track_cache
+@st.cache_resource(max_entries=VIEW_CACHE_SIZE)
+def long_range_figure(site, granularity, start, end, rev=()):
+    timing.mark_miss()
+    # Every year at Day/Hour steps on WebGL. The window is cut to at most
+    # TREND_POINTS by min/max bucketing, so the payload stays bounded however
+    # long the history; a narrow enough window is sent at full resolution.
+    x, y = downsample(*get_range_series(granularity, start, end, site=site), TREND_POINTS)
+
+    fig_line = go.Figure()
+    fig_line.add_trace(go.Scattergl(
+        x=x, y=y, mode="lines", name=granularity,
+        line=dict(color="#2563EB", width=1.5),
+        hovertemplate="%{x}: %{y:,.0f}<extra></extra>",
+    ))
+    fig_line.update_layout(
+        plot_bgcolor="white", paper_bgcolor="white",
+        height=240, margin=dict(l=0, r=0, t=20, b=10),
+        font=dict(family="Inter", size=11, color="#6B7280"),
+        xaxis=dict(showgrid=False, zeroline=False, showline=False, type="date",
+                   tickfont=dict(size=11, color="#6B7280")),
+        yaxis=dict(showgrid=True, gridcolor="#F3F4F6", zeroline=False,
+                   showline=False, tickfont=dict(size=10, color="#9CA3AF"),
+                   tickformat=",.0f"),
+        showlegend=False,
+        hovermode="x unified",
+    )
+    return fig_line
+
+def growth_heatmap(z, x, y, height):
+    text = [["" if v != v else f"{v:+.1f}%" for v in row] for row in z]
+    fig = go.Figure(go.Heatmap(
+        z=z, x=x, y=y, text=text, texttemplate="%{text}", textfont=dict(size=10, family="Inter"),
+        colorscale=GROWTH_SCALE, zmid=0, showscale=False, xgap=2, ygap=2,
+        hovertemplate="%{y} · %{x}: %{z:+.1f}%<extra></extra>",
+    ))
+    fig.update_layout(
+        plot_bgcolor="white", paper_bgcolor="white",
+        height=height, margin=dict(l=0, r=0, t=10, b=10),
+        font=dict(family="Inter", size=11, color="#6B7280"),
+        xaxis=dict(side="top", showgrid=False, zeroline=False, tickfont=dict(size=10, color="#6B7280")),
+        yaxis=dict(autorange="reversed", showgrid=False, zeroline=False, tickfont=dict(size=10, color="#6B7280")),
+    )
+    return fig
+
+@timing.track_cache
+@st.cache_resource(max_entries=VIEW_CACHE_SIZE)
+def growth_figures(site, month, chart_ap, chart_type, rev=()):
+    """(year × year growth for the chart filters, consecutive YoY per gate × type)."""
+    timing.mark_miss()
+    g   = build_growth(site, month, rev)
+    yrs = g["years"]
+    a   = g["access_points"].index(chart_ap)
+    t   = g["entry_types"].index(chart_type)
+
+    # Row year against column year; the diagonal is left blank
+    pair = g["pct"][:, :, a, t].copy()
+    np.fill_diagonal(pair, np.nan)
+    fig_pair = growth_heatmap(pair, [f"vs {y}" for y in yrs], [str(y) for y in yrs], 40 + 30 * len(yrs))
+
+    # Each year against the one before: the first subdiagonal of the pairwise array
+    steps = g["pct"][np.arange(1, len(yrs)), np.arange(len(yrs) - 1)]
+    rows  = [f"{ap} · {et}" for ap in g["access_points"] for et in g["entry_types"]]
+    fig_steps = growth_heatmap(
+        steps.reshape(len(yrs) - 1, -1).T,
+        [f"{y2} vs {y1}" for y1, y2 in zip(yrs, yrs[1:])], rows, 40 + 22 * len(rows),
+    )
+    return fig_pair, fig_steps
+
+
+# ── TOP BAR + HEADER ──────────────────────────────────────────────────────
+st.markdown('<div class="top-bar"></div>', unsafe_allow_html=True)
+
+# Header row with logo + filters
+header_l, header_r = st.columns([3, 2])
+
+# The site selector renders after the logo; its last value is in session state
+site = st.session_state.get("site", DEFAULT_SITE)
+site_word, _, site_rest = site.upper().partition(" ")
+YEARS, ACCESS_POINTS = site_axes(site)
+ap_label   = "Site" if site == ALL_SITES else "Access Point"
+gate_label = "Site" if site == ALL_SITES else "Gate"
+
+with header_l:
+    st.markdown(f"""
+    <div style="padding: 14px 28px 10px 28px; display:flex; align-items:center; gap:14px;">
+      <div style="background:#EFF6FF; border:1px solid #BFDBFE; border-radius:10px;
+                  padding:7px 11px; text-align:center; line-height:1.2;">
+        <div style="font-size:11px; font-weight:900; color:#2563EB;">{site_word}</div>
+        <div style="font-size:8px; font-weight:700; color:#2563EB; letter-spacing:.05em;">{site_rest}</div>
+      </div>
+      <div>
+        <div style="font-size:18px; font-weight:900; color:#111827; letter-spacing:-0.02em; line-height:1;">
+          VISITOR ENTRY FLOW
+        </div>
+        <div style="font-size:11px; color:#6B7280; margin-top:3px; font-weight:500;">
+          Year-over-Year Comparison &nbsp;·&nbsp; By {ap_label}
+        </div>
+      </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+with header_r:
+    st.markdown('<div style="height:10px;"></div>', unsafe_allow_html=True)
+    if len(SITE_NAMES) > 1:
+        st.selectbox("Site", SITE_NAMES + [ALL_SITES], key="site")
+    fc1, fc2, fc3, fc4 = st.columns(4)
+    with fc1:
+        year1 = st.selectbox("Year 1", [y for y in YEARS], index=YEARS.index(2026) if 2026 in YEARS else len(YEARS) - 1, key="year1")
+    with fc2:
+        yr2_opts = [y for y in YEARS if y != year1]
+        year2 = st.selectbox("Year 2", yr2_opts, index=yr2_opts.index(2024) if 2024 in yr2_opts else 0, key="year2")
+    with fc3:
+        month = st.selectbox("Month", MONTHS, index=0, key="month")
+    with fc4:
+        granularity = st.selectbox("Granularity", GRANULARITIES, index=0, key="granularity")
+    ranges = None
+    if st.toggle("Compare date ranges", key="use_range"):
+        # Default: the trailing 90 days of data against the same days a year earlier
+        first_day, end_day = (d.astype(datetime.date) for d in range_bounds(site))
+        last_day = end_day - datetime.timedelta(days=1)
+        max_day  = datetime.date(YEARS[-1], 12, 31)
+        for key in ("range1", "range2"):
+            if any(not first_day <= d <= max_day for d in st.session_state.get(key, ())):
+                del st.session_state[key]
+        d1 = (max(first_day, last_day - datetime.timedelta(days=89)), last_day)
+        d2 = tuple(max(first_day, years_back(d, 1)) for d in d1)
+        rc1, rc2 = st.columns(2)
+        with rc1:
+            p1 = st.date_input("Period 1", d1, first_day, max_day, key="range1", format="YYYY-MM-DD")
+        with rc2:
+            p2 = st.date_input("Period 2", d2, first_day, max_day, key="range2", format="YYYY-MM-DD")
+        # A range still being picked has one day or none yet
+        p1, p2 = (tuple(p) if len(p) == 2 else (p[0], p[0]) if p else d for p, d in ((p1, d1), (p2, d2)))
+        one = datetime.timedelta(days=1)
+        ranges = (str(p1[0]), str(p1[1] + one), str(p2[0]), str(p2[1] + one))
+        days   = ((p1[1] - p1[0]).days + 1, (p2[1] - p2[0]).days + 1)
+
+st.markdown('<div style="height:2px; background:#E8EAF0; margin: 0 0 20px 0;"></div>', unsafe_allow_html=True)
+
+# ── Pre-compute values ────────────────────────────────────────────────────
+# The chart filters render further down; their last values are already in
+# session state, so the whole selection can key a single view model here.
+with timing.section("precompute"):
+    # A gate picked on another site falls back to All until the widget resets
+    if st.session_state.get("chart_ap", "All") not in ["All"] + ACCESS_POINTS:
+        st.session_state["chart_ap"] = "All"
+    rev  = data_rev(year1, year2, site=site)
+    view = build_view(
+        site, year1, year2, month,
+        st.session_state.get("chart_ap", "All"),
+        st.session_state.get("chart_type", "All"),
+        rev,
+    )
+    ytd1, ytd2 = view["ytd"]
+    mo1,  mo2  = view["monthly"]
+    categories = view["categories"]
+    tag1, tag2 = year1, year2
+    bar_rev    = rev
+    # Date ranges replace the year/month selection in Sections 1–3
+    if ranges:
+        bar_rev = data_rev(*YEARS, site=site)
+        top = build_range_view(
+            site, *ranges,
+            st.session_state.get("chart_ap", "All"),
+            st.session_state.get("chart_type", "All"),
+            bar_rev,
+        )
+        ytd1, ytd2 = top["ytd"]
+        mo1,  mo2  = top["daily"]
+        categories = top["categories"]
+        tag1, tag2 = period_label(*p1), period_label(*p2)
+
+# ── SECTION 1 — YTD + Monthly ─────────────────────────────────────────────
+with st.container(), timing.section("ytd_cards"):
+    st.markdown('<div style="padding: 0 28px;">', unsafe_allow_html=True)
+    if ranges:
+        section_header("◈", f"Date-Range Entries — {tag1} vs {tag2}")
+        cards = [(f"Entries · {days[0]} vs {days[1]} days", ytd1, ytd2, True),
+                 ("Daily Average",                          mo1,  mo2,  False)]
+    else:
+        section_header("◈", f"Year-to-Date Entries — Jan through {month}")
+        cards = [(f"YTD Entries · Jan – {month}",    ytd1, ytd2, True),
+                 (f"Monthly Entries · {month} only", mo1,  mo2,  False)]
+
+    col1, col2 = st.columns(2, gap="medium")
+
+    for col, (label, v1, v2, accent) in zip((col1, col2), cards):
+        diff = v1 - v2
+        d    = calc_pct(v1, v2)
+        border_left = "border-left: 4px solid #2563EB;" if accent else ""
         with col:
-            bg      = "#EFF6FF" if sel else "transparent"
-            border  = "1px solid #BFDBFE" if sel else "1px solid transparent"
-            m_color = "#2563EB" if sel else "#6B7280"
-            m_fw    = "700" if sel else "500"
-            d_color = "#059669" if pos else "#DC2626"
-            arr     = "▲" if pos else "▼"
             st.markdown(f"""
-            <div style="text-align:center; border-radius:8px; padding:6px 2px;
-                        background:{bg}; border:{border}; cursor:pointer;">
-              <div style="font-size:9px; font-weight:{m_fw}; color:{m_color};">{m}</div>
-              <div style="font-size:9px; font-weight:700; color:{d_color}; margin-top:2px;">
-                {arr}{abs(d)}%
+            <div class="metric-card" style="{border_left}">
+              <div class="label-sm">{label}</div>
+              <div style="display:flex; gap:24px; align-items:flex-end; flex-wrap:wrap;">
+                <div>
+                  <div class="yr1-tag" style="margin-bottom:8px;">
+                    <div style="width:6px;height:6px;border-radius:50%;background:#2563EB;"></div>
+                    {tag1}
+                  </div>
+                  <div class="big-num" style="color:#111827;">{fmt_full(v1)}</div>
+                </div>
+                <div>
+                  <div class="yr2-tag" style="margin-bottom:8px;">
+                    <div style="width:6px;height:6px;border-radius:50%;background:#F59E0B;"></div>
+                    {tag2}
+                  </div>
+                  <div class="big-num-muted">{fmt_full(v2)}</div>
+                </div>
+                <div style="margin-left:auto; text-align:right;">
+                  <div style="font-size:10px;font-weight:600;color:#9CA3AF;text-transform:uppercase;letter-spacing:.07em;margin-bottom:4px;">Difference</div>
+                  <div style="font-size:15px;font-weight:700;color:{'#059669' if diff>=0 else '#DC2626'};margin-bottom:6px;">
+                    {'+'if diff>=0 else ''}{fmt_full(diff)}
+                  </div>
+                  {delta_pill(d)}
+                </div>
               </div>
             </div>
             """, unsafe_allow_html=True)
 
     st.markdown("</div>", unsafe_allow_html=True)
+
+st.markdown('<div style="height:20px;"></div>', unsafe_allow_html=True)
+
+# ── SECTION 2 — Category Breakdown ────────────────────────────────────────
+with st.container(), timing.section("category_cards"):
+    st.markdown('<div style="padding: 0 28px;">', unsafe_allow_html=True)
+    section_header("◉", "Breakdown by Entry Type" if ranges else "YTD Breakdown by Entry Type")
+
+    st.markdown(category_cards_html(tag1, tag2, categories), unsafe_allow_html=True)
+
+    st.markdown("</div>", unsafe_allow_html=True)
+
+st.markdown('<div style="height:20px;"></div>', unsafe_allow_html=True)
+
+# ── SECTION 3 — Bar Chart by Access Point ────────────────────────────────
+with st.container(), timing.section("bar_chart"):
+    st.markdown('<div style="padding: 0 28px;">', unsafe_allow_html=True)
+    section_header("◐", f"Entries by {ap_label}")
+
+    st.markdown('<div class="chart-card">', unsafe_allow_html=True)
+
+    bar_flags = 0 if ranges else sum(abs(b["z1"]) > Z_THRESHOLD or abs(b["z2"]) > Z_THRESHOLD for b in view["bars"])
+    flag_note = f" · ⚠ {bar_flags} off seasonal baseline" if bar_flags else ""
+    bar_scope = f"{tag1} vs {tag2}" if ranges else month
+
+    fh1, fh2, fh3 = st.columns([3, 1, 1])
+    with fh1:
+        st.markdown(f"""
+        <div>
+          <div style="font-size:14px;font-weight:700;color:#111827;">{"Period" if ranges else "Monthly"} Comparison by {gate_label}</div>
+          <div style="font-size:10px;color:#6B7280;margin-top:3px;">{bar_scope} · Selected filters apply{flag_note}</div>
+        </div>
+        """, unsafe_allow_html=True)
+    with fh2:
+        chart_ap = st.selectbox(ap_label, ["All"] + ACCESS_POINTS, key="chart_ap")
+    with fh3:
+        chart_type = st.selectbox("Entry Type", ["All"] + ENTRY_TYPES, key="chart_type")
+
+    fig_bar = bar_figure(site, tag1, tag2, month, chart_ap, chart_type, bar_rev, ranges)
+
+    st.plotly_chart(fig_bar, use_container_width=True, config={"displayModeBar": False})
+    st.markdown("</div>", unsafe_allow_html=True)
+    st.markdown("</div>", unsafe_allow_html=True)
+
+st.markdown('<div style="height:20px;"></div>', unsafe_allow_html=True)
+
+# ── SECTION 4 — Trend Line Chart ──────────────────────────────────────────
+with st.container():
+    st.markdown('<div style="padding: 0 28px;">', unsafe_allow_html=True)
+    with timing.section("trend_chart"):
+        # Long-range mode plots every year at Day/Hour steps; like the other
+        # filters, its toggle and zoom render below their last values
+        long_range = granularity in ("Day", "Hour") and st.session_state.get("long_range", False)
+        span = (datetime.date(YEARS[0], 1, 1), datetime.date(YEARS[-1], 12, 31))
+        zoom = st.session_state.get("zoom")
+        if long_range and not (zoom and span[0] <= zoom[0] <= zoom[1] <= span[1]):
+            zoom = st.session_state["zoom"] = span
+
+        trend_title, trend_unit = {
+            "Month": ("Monthly Trend Analysis — Full Year", "Month"),
+            "Week":  ("Weekly Trend Analysis — Full Year", "Week"),
+            "Day":   (f"Daily Trend Analysis — {month}", "Day"),
+            "Hour":  (f"Hourly Trend Analysis — {month}", "Hour"),
+        }[granularity]
+        trend_hint = (
+            "Selected month highlighted &nbsp;·&nbsp; Click on the delta row below to change month"
+            if granularity == "Month" else f"{year1} vs {year2} aligned by {trend_unit.lower()}"
+        )
+        legend1, legend2 = year1, year2
+        if long_range:
+            trend_title = f"{trend_title.split(' — ')[0]} — {YEARS[0]} to {YEARS[-1]}"
+            trend_hint  = (f"Up to {TREND_POINTS:,} points per view, keeping each interval's peaks"
+                           " &nbsp;·&nbsp; Narrow the zoom range below for full resolution")
+            legend1, legend2 = f"{zoom[0]:%b %Y} – {zoom[1]:%b %Y}", None
+        if granularity == "Month" and any(abs(z) > Z_THRESHOLD for zs in view["trend_z"] for z in zs):
+            trend_hint += " &nbsp;·&nbsp; Red rings mark months off their seasonal baseline"
+        section_header("◷", trend_title)
+
+        if granularity in ("Day", "Hour"):
+            st.toggle("All years", key="long_range")
+
+        overlay = ()
+        if granularity == "Month":
+            # Years picked as overlays drop out when they become Year 1 or 2
+            overlay_opts = [y for y in YEARS if y not in (year1, year2)]
+            if any(y not in overlay_opts for y in st.session_state.get("overlay", [])):
+                st.session_state["overlay"] = [y for y in st.session_state["overlay"] if y in overlay_opts]
+            overlay = tuple(sorted(st.multiselect("Overlay years", overlay_opts, key="overlay")))
+
+        # The first year has no earlier year to fit the seasonal shape on; a
+        # disabled toggle keeps its value, so it is checked again below
+        forecast   = None
+        no_history = year1 == YEARS[0]
+        project    = granularity == "Month" and st.toggle(
+            f"Project the rest of {year1}", key="forecast", disabled=no_history,
+            help=f"Needs a year before {year1}" if no_history else None)
+        if project and not no_history:
+            forecast = build_forecast(site, year1, month, data_rev(*YEARS, site=site))
+            trend_hint += (f" &nbsp;·&nbsp; Projected {year1} full year: {fmt_full(forecast['total'])}"
+                           f" ({fmt(forecast['total_low'])}–{fmt(forecast['total_high'])})")
+
+        st.markdown('<div class="chart-card">', unsafe_allow_html=True)
+
+        st.markdown(f"""
+        <div style="display:flex; justify-content:space-between; align-items:center; margin-bottom:16px;">
+          <div>
+            <div style="font-size:14px;font-weight:700;color:#111827;">Total Entries per {trend_unit}</div>
+            <div style="font-size:10px;color:#6B7280;margin-top:3px;">
+              {trend_hint}
+            </div>
+          </div>
+          <div style="display:flex; gap:20px; align-items:center;">
+            <div style="display:flex;align-items:center;gap:6px;">
+              <svg width="32" height="12">
+                <line x1="0" y1="6" x2="32" y2="6" stroke="#2563EB" stroke-width="2.5" stroke-linecap="round"/>
+                <circle cx="16" cy="6" r="4" fill="#2563EB"/>
+              </svg>
+              <span style="font-size:12px;font-weight:700;color:#2563EB;">{legend1}</span>
+            </div>
+            <div style="display:{'flex' if legend2 else 'none'};align-items:center;gap:6px;">
+              <svg width="32" height="12">
+                <line x1="0" y1="6" x2="32" y2="6" stroke="#F59E0B" stroke-width="2.5"
+                  stroke-dasharray="6,3" stroke-linecap="round"/>
+                <circle cx="16" cy="6" r="4" fill="#F59E0B"/>
+              </svg>
+              <span style="font-size:12px;font-weight:700;color:#F59E0B;">{legend2}</span>
+            </div>
+          </div>
+        </div>
+        """, unsafe_allow_html=True)
+
+        if granularity == "Month":
+            fig_line = trend_figure(site, year1, year2, month, rev, forecast,
+                                    overlay, data_rev(*overlay, site=site))
+        elif long_range:
+            fig_line = long_range_figure(site, granularity, *zoom, data_rev(*YEARS, site=site))
+        else:
+            fig_line = detail_trend_figure(site, year1, year2, month, granularity, rev)
+
+        st.plotly_chart(fig_line, use_container_width=True, config={"displayModeBar": False})
+        if long_range:
+            st.slider("Zoom", min_value=span[0], max_value=span[1], key="zoom", format="YYYY-MM-DD")
+
+    # ── Delta month row ───────────────────────────────────────────────────
+    with timing.section("delta_row"):
+        st.markdown(delta_row_html(month, view["deltas"]), unsafe_allow_html=True)
     st.markdown("</div>", unsafe_allow_html=True)  # chart-card
     st.markdown("</div>", unsafe_allow_html=True)  # padding container
 
+st.markdown('<div style="height:20px;"></div>', unsafe_allow_html=True)
+
+# ── SECTION 5 — Multi-Year Growth ─────────────────────────────────────────
+with st.container(), timing.section("growth_matrix"):
+    st.markdown('<div style="padding: 0 28px;">', unsafe_allow_html=True)
+    section_header("▦", f"Year-over-Year Growth — YTD Jan through {month}")
+
+    fig_pair, fig_steps = growth_figures(site, month, chart_ap, chart_type, data_rev(*YEARS, site=site))
+    gc1, gc2 = st.columns([2, 3], gap="medium")
+    with gc1:
+        st.markdown('<div class="chart-card">', unsafe_allow_html=True)
+        st.markdown(f"""
+        <div style="font-size:14px;font-weight:700;color:#111827;">Every Year Against Every Other</div>
+        <div style="font-size:10px;color:#6B7280;margin-top:3px;">{ap_label}: {chart_ap} · Entry type: {chart_type} · Row year vs column year</div>
+        """, unsafe_allow_html=True)
+        st.plotly_chart(fig_pair, use_container_width=True, config={"displayModeBar": False})
+        st.markdown("</div>", unsafe_allow_html=True)
+    with gc2:
+        st.markdown('<div class="chart-card">', unsafe_allow_html=True)
+        st.markdown(f"""
+        <div style="font-size:14px;font-weight:700;color:#111827;">YoY Growth by {gate_label} and Entry Type</div>
+        <div style="font-size:10px;color:#6B7280;margin-top:3px;">Each year against the one before</div>
+        """, unsafe_allow_html=True)
+        st.plotly_chart(fig_steps, use_container_width=True, config={"displayModeBar": False})
+        st.markdown("</div>", unsafe_allow_html=True)
+    st.markdown("</div>", unsafe_allow_html=True)
+
+st.markdown('<div style="height:20px;"></div>', unsafe_allow_html=True)
+
+# ── Export ────────────────────────────────────────────────────────────────
+with st.container(), timing.section("export"):
+    st.markdown('<div style="padding: 0 28px;">', unsafe_allow_html=True)
+    section_header("⇩", "Export")
+    site_slug = site.lower().replace(" ", "-")
+    if ranges:
+        # The view export follows Sections 1–3: the two periods under their labels
+        slug, shown = f"{site_slug}-{p1[0]}_{p1[1]}-vs-{p2[0]}_{p2[1]}", (top, tag1, tag2, None)
+    else:
+        slug, shown = f"{site_slug}-{year1}-vs-{year2}-{month.lower()}", (view, year1, year2, month)
+    cols = st.columns(5)
+    buttons = [
+        (fmt, f"View · {fmt.upper()}", f"{slug}.{fmt}",
+         lambda fmt, path: export_view(*shown, fmt, path, site))
+        for fmt in ("csv", "parquet", "xlsx")
+    ] + [
+        (fmt, f"All hours · {fmt.upper()}", f"{site_slug}-hourly.{fmt}",
+         lambda fmt, path: export(iter_detail(site), fmt, path))
+        for fmt in ("csv", "parquet")
+    ]
+    for col, (fmt, label, file_name, write) in zip(cols, buttons):
+        with col:
+            st.download_button(
+                label, lambda write=write, fmt=fmt: export_file(write, fmt),
+                file_name=file_name, mime=EXPORT_MIME[fmt], on_click="ignore",
+                disabled=not EXPORT_READY[fmt], key=f"export_{label}",
+                help=None if EXPORT_READY[fmt] else f"Install {'pyarrow' if fmt == 'parquet' else 'openpyxl'} to enable",
+                width="stretch",
+            )
+    st.markdown("</div>", unsafe_allow_html=True)
+
 # Bottom spacer
 st.markdown('<div style="height:32px;"></div>', unsafe_allow_html=True)
+
+timing.end_rerun()
+
+# ── Debug timings (?debug=1) ──────────────────────────────────────────────
+if st.query_params.get("debug") == "1":
+    stats = timing.summary()
+    with st.expander(f"Rerun timings · last {stats['reruns']} reruns", expanded=True):
+        tc1, tc2, tc3 = st.columns(3)
+        with tc1:
+            st.caption("Sections")
+            st.dataframe(pd.DataFrame.from_dict(stats["sections"], orient="index").round(2))
+        with tc2:
+            st.caption("Data functions")
+            st.dataframe(pd.DataFrame.from_dict(stats["functions"], orient="index").round(3))
+        with tc3:
+            st.caption("Caches")
+            st.dataframe(pd.DataFrame.from_dict(stats["caches"], orient="index").round(3))
+        refresh = refresh_stats()
+        if refresh["running"] or stats["background"]:
+            st.caption(f"Store refresher · every {refresh['interval_s']} s · {refresh['swaps']} swaps"
+                       f" in {refresh['checks']} checks" + (f" · last error: {refresh['last_error']}"
+                                                            if refresh["last_error"] else ""))
+            st.dataframe(pd.DataFrame.from_dict(stats["background"], orient="index").round(2))
+        st.download_button(
+            "Export JSON", timing.export_json(include_runs=True),
+            file_name="entry_flow_timings.json", mime="application/json",
+        )
@@ -0,0 +1,32 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+# entry_flow reads its configuration at import: point it at a private store
+# and the synthetic data before any test imports it
+os.environ["ENTRY_FLOW_STORE"] = tempfile.mkdtemp(prefix="entry_flow_test_")
+os.environ.pop("ENTRY_FLOW_SOURCE", None)
+os.environ.pop("ENTRY_FLOW_SITES", None)
+os.environ.pop("ENTRY_FLOW_WORKERS", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+_STORE_DIRS = itertools.count()
+
+
+@pytest.fixture
+def use_sites(monkeypatch, tmp_path):
+    """Point entry_flow at {site: export path} with an empty store and no cached state."""
+    import entry_flow as ef
+
+    def use(sites):
+        monkeypatch.setattr(ef, "SITES", dict(sites))
+        monkeypatch.setattr(ef, "SITE_NAMES", list(sites))
+        monkeypatch.setattr(ef, "DEFAULT_SITE", next(iter(sites)))
+        monkeypatch.setattr(ef, "STORE_DIR", str(tmp_path / f"store-{next(_STORE_DIRS)}"))
+        for name in ("_STORES", "_SOURCES", "_RANGE", "_ANOMALY", "_FORECAST"):
+            monkeypatch.setattr(ef, name, {})
+    return use
@@ -0,0 +1,261 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import entry_flow as ef
+
+STORE_ARRAYS = ["Month", "Week", "Day", "Hour", "ytd"]
+
+
+def test_ytd_index_matches_monthly_sums():
+    years, aps = ef.site_axes(ef.DEFAULT_SITE)
+    for yr, et, ap in itertools.product(years, ["All"] + ef.ENTRY_TYPES, ["All"] + aps):
+        running = 0
+        for m in ef.MONTHS:
+            running += ef.get_ap(yr, m, ap, et)
+            assert ef.get_ytd(yr, m, et, ap) == running, (yr, m, et, ap)
+
+
+def write_export(path, years, batch=()):
+    import pandas as pd
+    frames = list(ef.synthetic_readings(years, n_gates=2, bucket_minutes=1440))
+    frames.append(pd.DataFrame(list(batch), columns=["timestamp", "access_point", "entry_type", "count"]))
+    pd.concat(frames).to_csv(path, index=False)
+    return str(path)
+
+
+def test_append_matches_rebuild_and_leaves_the_export_cache(use_sites, tmp_path):
+    years = [2025, 2026]
+    batch = [("2025-03-04 10:15:00", "Gate 001", "Pedestrian", 40),
+             ("2026-02-28 23:59:00", "Gate 002", ef.ENTRY_TYPES[-1], 7),
+             ("2026-12-31 08:00:00", "Gate 001", ef.ENTRY_TYPES[0], 1000)]
+    source = write_export(tmp_path / "mall.csv", years)
+    use_sites({"Mall": source})
+    cache_before = np.array(ef.load_source(source)[0])
+    ef.append_counts(batch, site="Mall")
+    appended = {name: np.array(ef.load_store("Mall")[name]) for name in STORE_ARRAYS}
+    assert np.array_equal(ef.load_source(source)[0], cache_before)
+
+    use_sites({"Mall": write_export(tmp_path / "rebuilt.csv", years, batch)})
+    rebuilt = ef.load_store("Mall")
+    for name in STORE_ARRAYS:
+        assert np.array_equal(appended[name], rebuilt[name]), name
+
+    # A new store over the untouched export has none of the appended readings
+    use_sites({"Mall": source})
+    assert ef.get_ytd(2026, "Dec", site="Mall") == cache_before[1].sum()
+
+
+def test_single_year_export_is_rejected(use_sites, tmp_path):
+    use_sites({"Mall": write_export(tmp_path / "mall.csv", [2026])})
+    with pytest.raises(ValueError, match="at least two"):
+        ef.load_store("Mall")
+
+
+def test_forecast_band_coverage(use_sites):
+    # Synthetic sites differ only in their seeds, so together they give enough
+    # years to check how often the actual months and totals fall in the band
+    use_sites({f"Site {i}": None for i in range(8)})
+    months, totals = [], []
+    for site in ef.SITE_NAMES:
+        series = itertools.product(["All"] + ef.site_axes(site)[1], ["All"] + ef.ENTRY_TYPES)
+        for (ap, et), yr, upto in itertools.product(series, ef.YEARS[1:], ef.MONTHS[:-1]):
+            f = ef.get_forecast(yr, upto, ap, et, site)
+            actual = [ef.get_ap(yr, m, ap, et, site) for m in ef.MONTHS]
+            months += [lo <= v <= hi for v, lo, hi in zip(actual, f["low"], f["high"]) if lo is not None]
+            totals.append(f["total_low"] <= sum(actual) <= f["total_high"])
+    assert np.mean(months) >= 0.92
+    assert np.mean(totals) >= 0.9
+
+
+def test_range_view_export_uses_the_periods(tmp_path):
+    import pandas as pd
+    view = ef.range_view("2026-01-01", "2026-04-01", "2025-01-01", "2025-04-01")
+    ef.export_view(view, "Q1 2026", "Q1 2025", None, "csv", tmp_path / "view.csv")
+    rows = pd.read_csv(tmp_path / "view.csv")
+    assert set(rows["year1"]) == {"Q1 2026"} and set(rows["year2"]) == {"Q1 2025"}
+    assert list(rows["section"].unique()) == ["totals", "categories", "bars"]
+    q1 = sum(ef.get_ap(2026, m, "All", "All") for m in ef.MONTHS[:3])
+    assert rows.loc[rows["item"] == "Entries", "value1"].item() == q1
+    bars = rows[rows["section"] == "bars"].set_index("item")
+    for bar in view["bars"]:
+        assert bars.loc[bar["full_name"], ["value1", "value2"]].tolist() == [bar["p1"], bar["p2"]]
+
+
+def test_anomalies_flag_events_but_not_clean_data(use_sites, tmp_path):
+    import pandas as pd
+    use_sites({f"Site {i}": None for i in range(4)})
+    for site in ef.SITE_NAMES:
+        assert not (np.abs(ef.anomalies(site)) > ef.Z_THRESHOLD).any(), site
+
+    # A gate closed for a month and another gate with twice its usual month
+    readings = pd.concat(ef.synthetic_readings(ef.YEARS, n_gates=3, bucket_minutes=1440))
+    day    = pd.to_datetime(readings["timestamp"])
+    closed = (readings["access_point"] == "Gate 001") & (day.dt.year == 2024) & (day.dt.month == 6)
+    spike  = (readings["access_point"] == "Gate 002") & (day.dt.year == 2025) & (day.dt.month == 9)
+    readings.loc[spike, "count"] *= 2
+    readings[~closed].to_csv(tmp_path / "mall.csv", index=False)
+    use_sites({"Mall": str(tmp_path / "mall.csv")})
+    assert ef.get_anomaly(2024, "Jun", "Gate 001", site="Mall") < -ef.Z_THRESHOLD
+    assert ef.get_anomaly(2025, "Sep", "Gate 002", site="Mall") > ef.Z_THRESHOLD
+    yi, mi = np.nonzero((np.abs(ef.anomalies("Mall")) > ef.Z_THRESHOLD).any(axis=(2, 3)))
+    assert {(ef.YEARS[y], ef.MONTHS[m]) for y, m in zip(yi, mi)} == {(2024, "Jun"), (2025, "Sep")}
+
+
+def test_yoy_exits_quietly_when_the_reader_stops():
+    import subprocess
+    import sys
+    proc = subprocess.Popen([sys.executable, ef.__file__, "yoy", "2026", "2024"],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    proc.stdout.close()  # the reader is gone before the first row, as with a quick `| head`
+    assert proc.stderr.read() == b""
+    assert proc.wait() == 1
+
+
+def test_concurrent_cold_loads_build_one_store(use_sites):
+    import os
+    import threading
+    for run in range(3):
+        use_sites({"Mall": None, "Park": None})
+        stores, errors = [], []
+        start = threading.Barrier(8)
+
+        def load(site):
+            start.wait()
+            try:
+                stores.append(ef.load_store(site))
+            except Exception as exc:
+                errors.append(exc)
+        threads = [threading.Thread(target=load, args=(site,)) for site in ["Mall", "Park", ef.ALL_SITES] * 2 + ["Mall"] * 2]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors
+        assert len({id(store) for store in stores}) == 3
+        # No store maps a file another builder has since replaced, where appends would be lost
+        with open("/proc/self/maps") as fh:
+            assert not [line for line in fh if ef.STORE_DIR in line and line.rstrip().endswith("(deleted)")]
+        assert not [f for f in os.listdir(ef.STORE_DIR) if f.endswith(".tmp")]
+
+
+def test_forecast_needs_an_earlier_year():
+    with pytest.raises(ValueError, match="needs an earlier year"):
+        ef.get_forecast(ef.YEARS[0], "Mar")
+    assert ef.get_forecast(ef.YEARS[1], "Mar")["total_low"] is not None
+
+
+def test_refresh_removes_the_replaced_store(use_sites, tmp_path):
+    import os
+    north = write_export(tmp_path / "north.csv", [2025, 2026])
+    south = write_export(tmp_path / "south.csv", [2025, 2026])
+    use_sites({"North": north, "South": south})
+    old = ef.load_store("North")
+    ef.load_store(ef.ALL_SITES)
+    for site in ef.SITE_NAMES + [ef.ALL_SITES]:
+        ef.save_snapshot(site)
+    files = sorted(os.listdir(ef.STORE_DIR))
+
+    write_export(north, [2025, 2026], [("2026-05-01 10:00:00", "Gate 001", "Car", 5)])
+    os.utime(north, ns=(os.stat(north).st_mtime_ns + 10**9,) * 2)
+    assert ef.refresh() == ["North", ef.ALL_SITES]
+    after = sorted(os.listdir(ef.STORE_DIR))
+    assert len(after) == len(files)
+    assert not [f for f in after if old["key"] in f]
+    # A session still holding the old store keeps reading it
+    assert int(old["Month"].sum()) == int(ef.load_store("North")["Month"].sum()) - 5
+
+
+def test_concurrent_source_loads_ingest_once(use_sites, tmp_path, monkeypatch):
+    import threading
+    source = write_export(tmp_path / "mall.csv", [2025, 2026])
+    use_sites({"Mall": source})
+    calls, results = [], []
+    aggregate = ef.aggregate_counts
+    monkeypatch.setattr(ef, "aggregate_counts", lambda *args: calls.append(1) or aggregate(*args))
+    start = threading.Barrier(6)
+
+    def load():
+        start.wait()
+        results.append(ef.load_source(source))
+    threads = [threading.Thread(target=load) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1 and len(results) == 6
+
+
+def test_append_swaps_in_new_range_sums(use_sites):
+    use_sites({"Mall": None})
+    _, held = ef.range_index("Mall")
+    before  = held.copy()
+    ef.append_counts([("2024-07-04 12:00:00", "Gate 3", "Car", 50)], site="Mall")
+    assert ef.get_range("2024-07-04", "2024-07-05", "Gate 3", "Car", "Mall") == (
+        ef.get_series(2024, "Day", "Jul", "Gate 3", "Car", "Mall")[1][3])
+    assert ef.get_range("2022-01-01", "2027-01-01", site="Mall") == sum(
+        ef.get_ytd(yr, "Dec", site="Mall") for yr in ef.YEARS)
+    # A reader that took the old sums still sees them whole, not half updated
+    assert np.array_equal(held, before)
+
+
+def test_parallel_precompute_matches_lazy_build(use_sites, tmp_path):
+    import os
+    source = write_export(tmp_path / "mall.csv", [2024, 2025, 2026])
+    sites  = {"Mall": source, "Park": None}
+
+    def store_files():
+        return {name: open(os.path.join(ef.STORE_DIR, name), "rb").read() for name in os.listdir(ef.STORE_DIR)}
+    use_sites(sites)
+    assert ef.precompute(workers=3) == 2
+    built = store_files()
+    assert len(built) == 2 * len(["cube", "week", "day", "ytd", "hour", "rev"])
+
+    for suffix in (".buckets.npy", ".buckets.json"):
+        os.remove(source + suffix)
+    use_sites(sites)
+    for site in sites:
+        ef.load_store(site)
+    assert sorted(store_files()) == sorted(built)
+    for name, data in store_files().items():
+        assert data == built[name], name
+
+
+def _baseline_cube(years, n_gates):
+    # The dashboard's original per-cell loop, on Python floats and round()
+    import math
+
+    def s(n):
+        x = math.sin(n * 9301 + 49297) * 233280
+        return x - math.floor(x)
+
+    def rng(base, variance, seed):
+        return round(base + (s(seed) - 0.5) * variance * 2)
+    return [[[[rng(round(base * (1 + (yr - 2022) * 0.08)), variance, yr * 1000 + mi * 10 + ai + ti + 1)
+               for ti, (base, variance) in enumerate([(90000, 25000), (40000, 12000), (18000, 8000)])]
+              for ai in range(n_gates)]
+             for mi in range(len(ef.MONTHS))]
+            for yr in years]
+
+
+def test_synthetic_cube_matches_the_original_loop():
+    assert ef.synthetic_cube().tolist() == _baseline_cube(ef.YEARS, len(ef.ACCESS_POINTS))
+    years = list(range(2000, 2060))
+    assert ef.synthetic_cube(years, 40).tolist() == _baseline_cube(years, 40)
+
+
+def test_downsample_fills_the_budget_and_keeps_extremes():
+    rng = np.random.default_rng(0)
+    for n, points in [(1601, 1600), (5000, 1600), (1000, 7), (10, 2), (10, 1)]:
+        x = np.arange(n)
+        y = rng.uniform(100, 200, n)  # no ties, so every bucket gives two points
+        y[n // 3], y[2 * n // 3] = 1000, 0  # a spike and a dip
+        dx, dy = ef.downsample(x, y, points)
+        assert len(dx) == len(dy) <= points
+        assert len(dx) >= points - 1
+        assert np.all(np.diff(dx) > 0)
+        assert np.array_equal(dy, y[dx])
+        assert 1000 in dy and (points == 1 or 0 in dy)
+    x = np.arange(100)
+    assert ef.downsample(x, x, 100)[0] is x
@@ -0,0 +1,164 @@
+"""
+Per-rerun timing for the dashboard.
+Sections and data functions record into the current rerun; finished reruns go
+to a process-wide ring buffer that summary() and export_json() read.
+Outside a rerun (CLI, benchmarks) the wrappers just call through.
+Jobs off the request path (the store refresher) keep their own ring per name.
+"""
+
+import collections
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+RING_SIZE = int(os.environ.get("ENTRY_FLOW_TIMING_RING", "200"))
+
+_RING  = collections.deque(maxlen=RING_SIZE)
+_JOBS  = collections.defaultdict(lambda: collections.deque(maxlen=RING_SIZE))
+_LOCK  = threading.Lock()
+_local = threading.local()  # Streamlit runs each session's script in its own thread
+
+
+def start_rerun():
+    """Begin recording a rerun on this thread, dropping any unfinished one."""
+    _local.run = {
+        "started": time.time(),
+        "t0": time.perf_counter(),
+        "sections": {},
+        "calls": {},
+        "cache": {},
+    }
+    _local.misses = []
+
+
+def end_rerun():
+    """Close the current rerun and push it onto the ring buffer."""
+    run = getattr(_local, "run", None)
+    if run is None:
+        return
+    run["total"] = time.perf_counter() - run.pop("t0")
+    _local.run = None
+    with _LOCK:
+        _RING.append(run)
+
+
+@contextlib.contextmanager
+def section(name):
+    """Time a block of the page as one named section."""
+    run = getattr(_local, "run", None)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if run is not None:
+            run["sections"][name] = run["sections"].get(name, 0.0) + time.perf_counter() - t0
+
+
+@contextlib.contextmanager
+def background(name):
+    """Time one run of a job outside any rerun, e.g. a store refresh."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _LOCK:
+            _JOBS[name].append(time.perf_counter() - t0)
+
+
+def timed(fn):
+    """Accumulate call count and time of a data function per rerun."""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        run = getattr(_local, "run", None)
+        if run is None:
+            return fn(*args, **kwargs)
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            calls = run["calls"].setdefault(name, [0, 0.0])
+            calls[0] += 1
+            calls[1] += time.perf_counter() - t0
+    return wrapper
+
+
+def track_cache(fn):
+    """Count hits and misses of a Streamlit-cached function.
+
+    Goes outside the st.cache_* decorator; the cached body calls mark_miss(),
+    which only runs when the cache has no entry.
+    """
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        run = getattr(_local, "run", None)
+        if run is None:
+            return fn(*args, **kwargs)
+        _local.misses.append(False)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            missed = _local.misses.pop()
+            counts = run["cache"].setdefault(name, [0, 0])
+            counts[1 if missed else 0] += 1
+    wrapper.clear = fn.clear
+    return wrapper
+
+
+def mark_miss():
+    misses = getattr(_local, "misses", None)
+    if misses:
+        misses[-1] = True
+
+
+def _pct(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summary():
+    """p50/p95 per section, data function and background job, and hit ratio per cache, over the ring."""
+    with _LOCK:
+        runs = list(_RING)
+        jobs = {name: list(ring) for name, ring in _JOBS.items()}
+    out = {"reruns": len(runs), "sections": {}, "functions": {}, "caches": {}, "background": {}}
+    for name, values in jobs.items():
+        out["background"][name] = {
+            "runs": len(values), "last_ms": values[-1] * 1e3,
+            "p50_ms": _pct(values, 0.5) * 1e3, "p95_ms": _pct(values, 0.95) * 1e3,
+        }
+    if not runs:
+        return out
+
+    totals = [r["total"] for r in runs]
+    out["sections"]["total"] = {"p50_ms": _pct(totals, 0.5) * 1e3, "p95_ms": _pct(totals, 0.95) * 1e3}
+    for name in dict.fromkeys(k for r in runs for k in r["sections"]):
+        values = [r["sections"].get(name, 0.0) for r in runs]
+        out["sections"][name] = {"p50_ms": _pct(values, 0.5) * 1e3, "p95_ms": _pct(values, 0.95) * 1e3}
+    for name in dict.fromkeys(k for r in runs for k in r["calls"]):
+        calls = [r["calls"].get(name, [0, 0.0]) for r in runs]
+        out["functions"][name] = {
+            "calls_per_rerun": sum(c[0] for c in calls) / len(runs),
+            "p50_ms": _pct([c[1] for c in calls], 0.5) * 1e3,
+            "p95_ms": _pct([c[1] for c in calls], 0.95) * 1e3,
+        }
+    for name in dict.fromkeys(k for r in runs for k in r["cache"]):
+        hits   = sum(r["cache"].get(name, [0, 0])[0] for r in runs)
+        misses = sum(r["cache"].get(name, [0, 0])[1] for r in runs)
+        out["caches"][name] = {"hits": hits, "misses": misses, "hit_ratio": hits / ((hits + misses) or 1)}
+    return out
+
+
+def export_json(include_runs=False):
+    """Summary (and optionally the raw ring) as JSON for monitoring."""
+    data = summary()
+    if include_runs:
+        with _LOCK:
+            data["runs"] = list(_RING)
+    return json.dumps(data, indent=2)